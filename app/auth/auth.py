@@ -1,40 +1,55 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.database import SessionLocal
+from app.db.database import get_async_db
 from app.db.user import User
 from app.models.models import UserCreate, Token
-from app.auth.utils import hash_password, verify_password, create_access_token
+from app.auth.hashing import ahash_password, averify_password
+from app.auth.utils import create_access_token
 
 router = APIRouter(prefix="/auth")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def _get_user(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
 
 @router.post("/signup")
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    if db.query(User).filter(User.username == user.username).first():
+async def signup(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    if await _get_user(db, user.username):
         raise HTTPException(status_code=400, detail="User already exists")
 
     new_user = User(
         username=user.username,
-        hashed_password=hash_password(user.password)
+        hashed_password=await ahash_password(user.password)
     )
     db.add(new_user)
-    db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent signup for the same name
+        raise HTTPException(status_code=400, detail="User already exists")
 
     return {"message": "User created successfully"}
 
 @router.post("/login", response_model=Token)
-def login(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
+async def login(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    db_user = await _get_user(db, user.username)
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    if not db_user or not verify_password(user.password, db_user.hashed_password):
+    valid, new_hash = await averify_password(user.password, db_user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # Argon2 settings changed since this hash was made: store the upgraded one
+    if new_hash:
+        db_user.hashed_password = new_hash
+        try:
+            await db.commit()
+        except Exception as e:
+            print("⚠️ Failed to rehash password:", e)
+
     token = create_access_token({"sub": db_user.username})
     return {"access_token": token, "token_type": "bearer"}
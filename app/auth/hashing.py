@@ -0,0 +1,86 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+from app.auth.utils import hash_password, verify_and_update_password
+
+# Password hashing runs on its own small pool (argon2 releases the GIL), so a
+# login burst queues here instead of starving the threadpool used by every
+# other endpoint. Past PASSWORD_HASH_MAX_PENDING waiting + running jobs new
+# requests are turned away with a 503 rather than piling up.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+PASSWORD_HASH_RETRY_AFTER = os.getenv("PASSWORD_HASH_RETRY_AFTER", "1")
+
+
+class HashingPool:
+    def __init__(self, workers: int, max_pending: int):
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="argon2")
+        self._lock = threading.Lock()
+        self.workers = workers
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _timed(self, fn, args, submitted):
+        started = time.perf_counter()
+        with self._lock:
+            self.running += 1
+            self.wait_seconds += started - submitted
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.run_seconds += time.perf_counter() - started
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many authentication requests, try again shortly",
+                    headers={"Retry-After": PASSWORD_HASH_RETRY_AFTER},
+                )
+            self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, self._timed, fn, args, time.perf_counter())
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "running": self.running,
+                "queued": self.pending - self.running,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": 1000 * self.wait_seconds / self.completed if self.completed else 0.0,
+                "avg_run_ms": 1000 * self.run_seconds / self.completed if self.completed else 0.0,
+            }
+
+
+hashing_pool = HashingPool(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+
+async def ahash_password(password: str) -> str:
+    return await hashing_pool.run(hash_password, password)
+
+
+async def averify_password(password: str, hashed_password: str):
+    """Return (valid, new hash or None) without blocking the event loop."""
+    return await hashing_pool.run(verify_and_update_password, password, hashed_password)
@@ -9,17 +9,32 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Argon2 cost parameters; hashes made with other settings are upgraded on
+# the next successful login (see verify_and_update_password). Before these
+# were set, passlib used the installed argon2-cffi's defaults: the same
+# 3 / 64 MiB / 4 with the pinned 25.1.0, but 2 / 100 MiB / 8 before 21.2. When
+# these values differ from the ones stored hashes were made with (an older
+# argon2-cffi, or changing the env vars), every existing user is rehashed
+# once, on their next login.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
 # Use Argon2 instead of bcrypt
 pwd_context = CryptContext(
     schemes=["argon2"],
-    deprecated="auto"
+    deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
 )
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+def verify_and_update_password(plain_password: str, hashed_password: str):
+    """Return (valid, new hash or None if the stored one is current)."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
@@ -1,16 +1,115 @@
+import re
+import threading
+
+import numpy as np
 import tiktoken
 
 enc = tiktoken.get_encoding("cl100k_base")
 
-def chunk_text(text: str, max_tokens=300, overlap=50):
-    tokens = enc.encode(text)
-    chunks = []
+# Places a chunk may end when snapping to boundaries, best first
+PARAGRAPH_BREAK = re.compile(rb"\n[ \t]*\n")
+SENTENCE_END = re.compile(rb"[.!?][\"')\]]*[ \t\r\n]|\n")
+BOUNDARIES = {
+    "paragraph": (PARAGRAPH_BREAK, SENTENCE_END),
+    "sentence": (SENTENCE_END,),
+}
+
+_token_bytes = None
+_token_bytes_lock = threading.Lock()
+
+
+def _token_byte_lengths():
+    # UTF-8 length of every token, so chunk text can be sliced from the
+    # source bytes instead of decoding (overlapping) token lists.
+    global _token_bytes
+    if _token_bytes is None:
+        with _token_bytes_lock:
+            if _token_bytes is None:
+                lengths = np.zeros(enc.max_token_value + 1, dtype=np.int64)
+                for token in range(enc.max_token_value + 1):
+                    try:
+                        lengths[token] = len(enc.decode_single_token_bytes(token))
+                    except KeyError:
+                        pass
+                _token_bytes = lengths
+    return _token_bytes
+
+
+def _encode(pieces, batch_size):
+    batch = []
+    for piece in pieces:
+        batch.append(piece)
+        if len(batch) >= batch_size:
+            yield from zip(batch, enc.encode_ordinary_batch(batch))
+            batch = []
+    if batch:
+        yield from zip(batch, enc.encode_ordinary_batch(batch))
+
+
+def _cut(buf, ends, max_tokens, overlap, boundary):
+    if boundary is None:
+        return max_tokens
+    # Never shrink a chunk below half size (or into the overlap)
+    min_cut = max(overlap + 1, max_tokens // 2)
+    lo, hi = int(ends[min_cut - 1]), int(ends[max_tokens - 1])
+    for pattern in BOUNDARIES[boundary]:
+        pos = None
+        for match in pattern.finditer(buf, lo, hi):
+            pos = match.end()
+        if pos is not None:
+            cut = int(np.searchsorted(ends, pos, side="right"))
+            if cut >= min_cut:
+                return cut
+    return max_tokens
+
 
-    start = 0
-    while start < len(tokens):
-        end = start + max_tokens
-        chunk = enc.decode(tokens[start:end])
-        chunks.append(chunk)
-        start = end - overlap
+def _chunk_encoded(encoded, max_tokens, overlap, boundary):
+    lengths = _token_byte_lengths()
+    buf = bytearray()
+    ends = np.zeros(0, dtype=np.int64)  # byte offset in buf where each token ends
+    covered = 0  # leading tokens of buf already emitted in the previous chunk
 
-    return chunks
+    for piece, tokens in encoded:
+        if not tokens:
+            continue
+        base = len(buf)
+        buf += piece.encode("utf-8")
+        ends = np.concatenate([ends, base + np.cumsum(lengths[np.asarray(tokens)])])
+
+        while len(ends) >= max_tokens:
+            cut = _cut(buf, ends, max_tokens, overlap, boundary)
+            yield buf[:ends[cut - 1]].decode("utf-8", errors="replace")
+            drop = cut - overlap
+            dropped = int(ends[drop - 1])
+            del buf[:dropped]
+            ends = ends[drop:] - dropped
+            covered = overlap
+
+    if len(ends) > covered:
+        yield buf.decode("utf-8", errors="replace")
+
+
+def iter_chunks(pieces, max_tokens=300, overlap=50, boundary=None, batch_size=16):
+    """Stream chunks from an iterable of text pieces (pages, paragraphs, blocks).
+
+    Pieces are treated as contiguous text and encoded batch_size at a time.
+    boundary=None cuts at exactly max_tokens like chunk_text(); "sentence" or
+    "paragraph" end chunks at the last such boundary in their second half.
+    """
+    if boundary is not None and boundary not in BOUNDARIES:
+        raise ValueError(f"Unknown chunk boundary: {boundary}")
+    if overlap >= max_tokens:
+        raise ValueError("overlap must be smaller than max_tokens")
+    return _chunk_encoded(_encode(pieces, batch_size), max_tokens, overlap, boundary)
+
+
+def chunk_documents(texts: list[str], max_tokens=300, overlap=50, boundary=None):
+    """Chunk several documents with a single batched encode call."""
+    return [
+        list(_chunk_encoded([(text, tokens)], max_tokens, overlap, boundary))
+        for text, tokens in zip(texts, enc.encode_ordinary_batch(texts))
+    ]
+
+
+def chunk_text(text: str, max_tokens=300, overlap=50):
+    return list(iter_chunks([text], max_tokens=max_tokens, overlap=overlap))
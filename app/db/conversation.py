@@ -1,5 +1,5 @@
 # app/db/conversation.py
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Index, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from uuid import uuid4
@@ -7,6 +7,10 @@ from app.db.database import Base
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # Keyset pagination of a user's conversations, newest activity first
+        Index("ix_conversations_user_updated", "user_id", "updated_at", "id"),
+    )
     id = Column(String, primary_key=True, default=lambda: str(uuid4()), nullable=False)
     user_id = Column(String, index=True, nullable=False)
     title = Column(String, nullable=True)
@@ -18,13 +22,30 @@ class Conversation(Base):
         back_populates="conversation",
         cascade="all, delete-orphan"
     )
+    summary = relationship(
+        "ConversationSummary",
+        uselist=False,
+        cascade="all, delete-orphan"
+    )
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # History reads and keyset pagination within a conversation
+        Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+    )
     id = Column(String, primary_key=True, default=lambda: str(uuid4()), nullable=False)
     conversation_id = Column(String, ForeignKey("conversations.id", ondelete="CASCADE"), index=True, nullable=False)
     role = Column(String, nullable=False)      # "user" | "assistant" | "system"
     content = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
-    conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
+    conversation = relationship("Conversation", back_populates="messages")
+
+class ConversationSummary(Base):
+    # Rolling summary of the turns that fell out of the history window
+    __tablename__ = "conversation_summaries"
+    conversation_id = Column(String, ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    summarized_until = Column(DateTime, nullable=True)  # created_at of the last folded message
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
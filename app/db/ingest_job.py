@@ -0,0 +1,22 @@
+# app/db/ingest_job.py
+from sqlalchemy import Column, String, DateTime, Integer, Text
+from datetime import datetime
+from uuid import uuid4
+from app.db.database import Base
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+    id = Column(String, primary_key=True, default=lambda: str(uuid4()), nullable=False)
+    user_id = Column(String, index=True, nullable=False)
+    conversation_id = Column(String, index=True, nullable=False)
+    filename = Column(String, nullable=False)
+    index_mode = Column(String, nullable=True)                 # applied if this upload creates the store
+    status = Column(String, nullable=False, default="queued")  # "queued" | "running" | "done" | "failed"
+    stage = Column(String, nullable=True)                      # "parse" | "embed" | "index"
+    chunks_total = Column(Integer, nullable=True)              # known once chunking finishes
+    chunks_embedded = Column(Integer, nullable=False, default=0)
+    chunks_stored = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
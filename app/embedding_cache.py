@@ -0,0 +1,113 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# In-process LRU in front of an optional SQLite file shared by all workers.
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "4096"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH")
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int, path: str | None = None):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def persistent(self) -> bool:
+        """Whether lookups may hit the SQLite tier (blocking I/O)."""
+        return self._db is not None
+
+    def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        found = [None] * len(keys)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.append(i)
+
+        if missing and self._db is not None:
+            rows = self._read([keys[i] for i in missing])
+            still_missing = []
+            for i in missing:
+                blob = rows.get(keys[i])
+                if blob is None:
+                    still_missing.append(i)
+                    continue
+                found[i] = np.frombuffer(blob, dtype=np.float32)
+                self._remember(keys[i], found[i])
+            with self._lock:
+                self.disk_hits += len(missing) - len(still_missing)
+            missing = still_missing
+
+        with self._lock:
+            self.misses += len(missing)
+        return found
+
+    def put_many(self, keys: list[str], vectors: list[np.ndarray]):
+        for key, vector in zip(keys, vectors):
+            self._remember(key, vector)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(v, dtype=np.float32).tobytes()) for key, v in zip(keys, vectors)],
+                )
+
+    def _read(self, keys: list[str]) -> dict:
+        rows = {}
+        with self._db_lock:
+            # stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall())
+        return rows
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+embedding_cache = EmbeddingCache(EMBED_CACHE_MAX_ENTRIES, EMBED_CACHE_PATH)
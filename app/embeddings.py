@@ -1,17 +1,169 @@
-from openai import OpenAI
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from openai import (
+    AsyncOpenAI,
+    OpenAI,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+
+from app.chunker import enc
+from app.embedding_cache import cache_key, embedding_cache
+from app.metrics import embedding_inputs, embedding_request_seconds, embedding_retries
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# API limits: 2048 inputs and 300k tokens per request, 8191 tokens per input.
+# Defaults stay a little under the hard caps.
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "512"))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "250000"))
+EMBED_MAX_INPUT_TOKENS = 8191
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "0.5"))
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", "20"))
+
+# EMBEDDINGS_BASE_URL points only the embedding calls at another server
+# (e.g. benchmarks/fake_openai.py); retries are handled below.
+client = OpenAI(base_url=os.getenv("EMBEDDINGS_BASE_URL") or None, max_retries=0)
+async_client = AsyncOpenAI(base_url=os.getenv("EMBEDDINGS_BASE_URL") or None, max_retries=0)
+
+# Shared by all requests, so this also bounds concurrent embedding calls per process
+_pool = ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY, thread_name_prefix="embed")
+
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+
+def _retry_after(error) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(error, attempt) -> float:
+    delay = _retry_after(error)
+    if delay is None:
+        delay = min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * 2 ** attempt)
+        delay *= random.uniform(0.5, 1.0)
+    return delay
+
+
+def _kind(inputs):
+    return "query" if isinstance(inputs, str) else "documents"
+
+
+def _create(inputs):
+    kind = _kind(inputs)
+    embedding_inputs.inc(1 if kind == "query" else len(inputs), kind)
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            with embedding_request_seconds.time(kind):
+                return client.embeddings.create(model=EMBEDDING_MODEL, input=inputs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            embedding_retries.inc()
+            time.sleep(_backoff(e, attempt))
+
+
+async def _acreate(inputs):
+    kind = _kind(inputs)
+    embedding_inputs.inc(1 if kind == "query" else len(inputs), kind)
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            with embedding_request_seconds.time(kind):
+                return await async_client.embeddings.create(model=EMBEDDING_MODEL, input=inputs)
+        except RETRYABLE_ERRORS as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            embedding_retries.inc()
+            await asyncio.sleep(_backoff(e, attempt))
+
+
+def split_batches(texts: list[str]):
+    """Split texts into request-sized batches under the item and token limits."""
+    batches = []
+    current, current_tokens = [], 0
+    for text, tokens in zip(texts, enc.encode_ordinary_batch(texts)):
+        if len(tokens) > EMBED_MAX_INPUT_TOKENS:
+            tokens = tokens[:EMBED_MAX_INPUT_TOKENS]
+            text = enc.decode(tokens)
+        if current and (
+            len(current) >= EMBED_BATCH_MAX_ITEMS
+            or current_tokens + len(tokens) > EMBED_BATCH_MAX_TOKENS
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += len(tokens)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _embed_batch(inputs):
+    res = _create(inputs)
+    return [
+        np.asarray(d.embedding, dtype=np.float32)
+        for d in sorted(res.data, key=lambda d: d.index)
+    ]
+
+
+def _embed_uncached(texts: list[str]):
+    # Even a single batch goes through the pool so EMBED_CONCURRENCY holds.
+    # pool.map keeps batch order, so outputs line up with the inputs
+    results = _pool.map(_embed_batch, split_batches(texts))
+    return [embedding for batch in results for embedding in batch]
 
-client = OpenAI()
 
 def embed_texts(texts: list[str]):
-    res = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=texts
-    )
-    return [d.embedding for d in res.data]
-
-def embed_query(query: str):
-    res = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=query
-    )
-    return res.data[0].embedding
+    if not texts:
+        return []
+    keys = [cache_key(EMBEDDING_MODEL, text) for text in texts]
+    embeddings = embedding_cache.get_many(keys)
+
+    # Only send chunks we have never seen, once each
+    missing = {}
+    for key, text, embedding in zip(keys, texts, embeddings):
+        if embedding is None:
+            missing.setdefault(key, text)
+    if missing:
+        fresh = dict(zip(missing, _embed_uncached(list(missing.values()))))
+        embedding_cache.put_many(list(fresh), list(fresh.values()))
+        embeddings = [fresh[key] if e is None else e for key, e in zip(keys, embeddings)]
+    return embeddings
+
+
+def _query_key(query: str) -> str:
+    # Whitespace-only differences between repeated prompts share one entry
+    return cache_key(EMBEDDING_MODEL, " ".join(query.split()))
+
+
+async def _cached(fn, *args):
+    # The SQLite tier blocks, and ingest threads hold its lock across big
+    # writes, so keep it off the event loop
+    if embedding_cache.persistent:
+        return await run_in_threadpool(fn, *args)
+    return fn(*args)
+
+
+async def aembed_query(query: str):
+    key = _query_key(query)
+    embedding = (await _cached(embedding_cache.get_many, [key]))[0]
+    if embedding is None:
+        res = await _acreate(query)
+        embedding = np.asarray(res.data[0].embedding, dtype=np.float32)
+        await _cached(embedding_cache.put_many, [key], [embedding])
+    return embedding
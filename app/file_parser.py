@@ -1,17 +1,119 @@
+import codecs
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 from pypdf import PdfReader
 from docx import Document
-import io
 
-def extract_text(filename: str, content: bytes) -> str:
+# Parsing is CPU-bound pure Python, so it runs in a process pool and is
+# streamed back a few pages at a time instead of as one giant string.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+PARSE_PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", "8"))
+# Page-range tasks in flight per document; bounds buffered text for huge PDFs
+PARSE_MAX_INFLIGHT = int(os.getenv("PARSE_MAX_INFLIGHT", "4"))
+TXT_READ_SIZE = 64 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver: don't fork a process that already runs server threads
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _pool
+
+
+def _reset_pool(broken):
+    # A worker died (OOM, parser crash) and took the executor with it; the
+    # next _get_pool() starts a fresh one
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _call(fn, *args):
+    """Run fn in the parse pool, retrying once on a fresh pool if it broke."""
+    pool = _get_pool()
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        return _get_pool().submit(fn, *args).result()
+
+
+def _pdf_page_count(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def _pdf_pages(path: str, start: int, end: int) -> list[str]:
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _docx_paragraphs(path: str) -> list[str]:
+    return [p.text for p in Document(path).paragraphs]
+
+
+def _iter_pdf_pages(pool, path: str, first: int, pages: int):
+    ranges = iter(range(first, pages, PARSE_PAGES_PER_TASK))
+    pending = deque()
+    for start in ranges:
+        pending.append(pool.submit(_pdf_pages, path, start, min(start + PARSE_PAGES_PER_TASK, pages)))
+        if len(pending) >= PARSE_MAX_INFLIGHT:
+            break
+    while pending:
+        yield from pending.popleft().result()
+        start = next(ranges, None)
+        if start is not None:
+            pending.append(pool.submit(_pdf_pages, path, start, min(start + PARSE_PAGES_PER_TASK, pages)))
+
+
+def _iter_pdf(path: str):
+    pages = _call(_pdf_page_count, path)
+    done = 0
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            # On retry, pick up after the last page already yielded
+            for text in _iter_pdf_pages(pool, path, done, pages):
+                done += 1
+                yield text
+            return
+        except BrokenProcessPool:
+            _reset_pool(pool)
+            if attempt:
+                raise
+
+
+def _iter_txt(path: str):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    with open(path, "rb") as f:
+        while block := f.read(TXT_READ_SIZE):
+            yield decoder.decode(block)
+    yield decoder.decode(b"", final=True)
+
+
+def iter_text(filename: str, path: str):
+    """Yield a document's text incrementally: PDF pages, DOCX paragraphs or TXT blocks."""
     if filename.endswith(".pdf"):
-        reader = PdfReader(io.BytesIO(content))
-        return "\n".join(page.extract_text() or "" for page in reader.pages)
+        return _iter_pdf(path)
 
     if filename.endswith(".docx"):
-        doc = Document(io.BytesIO(content))
-        return "\n".join(p.text for p in doc.paragraphs)
+        return iter(_call(_docx_paragraphs, path))
 
     if filename.endswith(".txt"):
-        return content.decode("utf-8", errors="ignore")
+        return _iter_txt(path)
 
     raise ValueError("Unsupported file type")
@@ -0,0 +1,327 @@
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app.chunker import iter_chunks
+from app.db.conversation import Conversation
+from app.db.database import SessionLocal
+from app.db.ingest_job import IngestJob
+from app.embeddings import embed_texts
+from app.file_parser import iter_text
+from app.metrics import ingest_chunks, ingest_chunks_reused, ingest_jobs, ingest_stage_seconds
+from app.rag_store import get_store
+from app.vector_store import chunk_hash
+
+# Uploads are parsed -> chunked -> embedded -> indexed by a worker pool, one
+# thread per stage, connected by bounded queues so a slow stage applies
+# backpressure instead of buffering the whole document.
+# Each upload becomes a document of its store. Re-uploading a file name
+# replaces that document: an identical file is skipped outright, otherwise
+# only chunks whose content hash the store doesn't have yet are embedded.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Optional chunk boundary snapping: "sentence" or "paragraph"
+INGEST_CHUNK_BOUNDARY = os.getenv("INGEST_CHUNK_BOUNDARY") or None
+INGEST_UPLOAD_DIR = os.getenv("INGEST_UPLOAD_DIR") or tempfile.gettempdir()
+os.makedirs(INGEST_UPLOAD_DIR, exist_ok=True)
+# Jobs live in an in-process pool, so a restart or crash strands them. A
+# queued/running job not updated for this long is failed and its spool file
+# removed. Every worker heartbeats the jobs it holds (queued or running) a few
+# times per period, so only jobs of a dead process go stale.
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "600"))
+
+_DONE = object()
+_active = set()  # job ids queued or running in this process
+_active_lock = threading.Lock()
+_heartbeat = None
+
+
+class IngestError(Exception):
+    pass
+
+
+class _Pipeline:
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.failed = threading.Event()
+        self.error = None
+
+    def fail(self, error: Exception):
+        if not self.failed.is_set():
+            self.error = error
+            self.failed.set()
+
+    def put(self, q: queue.Queue, item):
+        # Give up instead of blocking forever if a downstream stage died
+        while not self.failed.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, q: queue.Queue):
+        while not self.failed.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+
+def upload_path(job_id: str) -> str:
+    return os.path.join(INGEST_UPLOAD_DIR, f"ingest-{job_id}")
+
+
+def _update_job(job_id: str, **fields):
+    with SessionLocal() as db:
+        job = db.get(IngestJob, job_id)
+        for name, value in fields.items():
+            setattr(job, name, value)
+        db.commit()
+
+
+def _increment_job(job_id: str, field: str, amount: int):
+    with SessionLocal() as db:
+        db.query(IngestJob).filter(IngestJob.id == job_id).update(
+            {getattr(IngestJob, field): getattr(IngestJob, field) + amount},
+            synchronize_session=False,
+        )
+        db.commit()
+
+
+def _parse_stage(pipeline: _Pipeline, job: dict, out: queue.Queue):
+    start = time.perf_counter()
+    try:
+        total, batch = 0, []
+        # Chunks flow downstream while later pages are still being parsed
+        pieces = (piece + "\n" for piece in iter_text(job["filename"], job["path"]))
+        for chunk in iter_chunks(pieces, boundary=INGEST_CHUNK_BOUNDARY):
+            if pipeline.failed.is_set():
+                return
+            if not chunk.strip():
+                continue
+            batch.append(chunk)
+            if len(batch) >= INGEST_BATCH_SIZE:
+                pipeline.put(out, batch)
+                total, batch = total + len(batch), []
+        if batch:
+            pipeline.put(out, batch)
+            total += len(batch)
+        if not total:
+            raise IngestError("Empty document")
+        _update_job(pipeline.job_id, chunks_total=total, stage="embed")
+        ingest_stage_seconds.observe(time.perf_counter() - start, "parse")
+    except Exception as e:
+        pipeline.fail(e)
+    finally:
+        pipeline.put(out, _DONE)
+
+
+def _embed_stage(pipeline: _Pipeline, job: dict, inp: queue.Queue, out: queue.Queue):
+    known, seen = job["known"], set()
+    try:
+        while (chunks := pipeline.get(inp)) is not _DONE:
+            hashes = [chunk_hash(chunk) for chunk in chunks]
+            job["hashes"].extend(hashes)
+            new_texts, new_hashes = [], []
+            for chunk, h in zip(chunks, hashes):
+                if h not in known and h not in seen:
+                    seen.add(h)
+                    new_texts.append(chunk)
+                    new_hashes.append(h)
+            embeddings = []
+            if new_texts:
+                with ingest_stage_seconds.time("embed_batch"):
+                    embeddings = embed_texts(new_texts)
+                _increment_job(pipeline.job_id, "chunks_embedded", len(new_texts))
+            pipeline.put(out, (embeddings, new_texts, new_hashes, len(chunks)))
+        if not pipeline.failed.is_set():
+            _update_job(pipeline.job_id, stage="index")
+    except Exception as e:
+        pipeline.fail(e)
+    finally:
+        pipeline.put(out, _DONE)
+
+
+def _indexed_batches(pipeline: _Pipeline, inp: queue.Queue):
+    while (batch := pipeline.get(inp)) is not _DONE:
+        embeddings, texts, hashes, count = batch
+        if texts:
+            yield embeddings, texts, hashes
+        # Reused chunks count as stored so progress still reaches chunks_total
+        _increment_job(pipeline.job_id, "chunks_stored", count)
+        ingest_chunks.inc(len(texts))
+        ingest_chunks_reused.inc(count - len(texts))
+    # Raising inside add_document() keeps a failed upload from being published
+    if pipeline.failed.is_set():
+        raise pipeline.error
+
+
+def _file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def run_job(job_id: str):
+    with SessionLocal() as db:
+        # Claim the job; it may have been failed as stale while it waited
+        claimed = db.query(IngestJob).filter(
+            IngestJob.id == job_id, IngestJob.status == "queued"
+        ).update({IngestJob.status: "running", IngestJob.stage: "parse"}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            _remove_spool(job_id)
+            return
+        row = db.get(IngestJob, job_id)
+        job = {
+            "user": row.user_id,
+            "conversation_id": row.conversation_id,
+            "filename": row.filename,
+            "index_mode": row.index_mode,
+            "path": upload_path(job_id),
+        }
+    start = time.perf_counter()
+
+    pipeline = _Pipeline(job_id)
+    chunks_q = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    embedded_q = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    stages = [
+        threading.Thread(target=_parse_stage, args=(pipeline, job, chunks_q), daemon=True),
+        threading.Thread(target=_embed_stage, args=(pipeline, job, chunks_q, embedded_q), daemon=True),
+    ]
+    try:
+        store = get_store(job["user"], job["conversation_id"], create=True, mode=job["index_mode"])
+        sha256 = _file_digest(job["path"])
+        _, _, meta, manifest = store.snapshot
+        previous = manifest.find(job["filename"])
+        if previous is not None and manifest.documents[previous]["sha256"] == sha256:
+            count = len(manifest.documents[previous]["chunks"])
+            _update_job(
+                job_id, status="done", stage=None, chunks_total=count, chunks_stored=count,
+                finished_at=datetime.utcnow()
+            )
+            ingest_jobs.inc(1, "unchanged")
+            return
+
+        job["known"] = manifest.chunk_ids()
+        job["hashes"] = []
+        for stage in stages:
+            stage.start()
+
+        with ingest_stage_seconds.time("index"):
+            store.add_document(
+                job["filename"], sha256, job["hashes"], _indexed_batches(pipeline, embedded_q),
+                job["known"], meta.get("generation", 0)
+            )
+        for stage in stages:
+            stage.join()
+
+        with SessionLocal() as db:
+            convo = db.get(Conversation, job["conversation_id"])
+            if convo:
+                convo.updated_at = datetime.utcnow()
+                db.commit()
+        _update_job(job_id, status="done", stage=None, finished_at=datetime.utcnow())
+        ingest_jobs.inc(1, "done")
+    except Exception as e:
+        pipeline.fail(e)
+        print("Upload error:", e)
+        message = str(e) if isinstance(e, (IngestError, ValueError)) else "Failed to process file"
+        _update_job(job_id, status="failed", error=message, finished_at=datetime.utcnow())
+        ingest_jobs.inc(1, "failed")
+    finally:
+        ingest_stage_seconds.observe(time.perf_counter() - start, "job")
+        try:
+            os.remove(job["path"])
+        except OSError:
+            pass
+
+
+def _remove_spool(job_id: str):
+    try:
+        os.remove(upload_path(job_id))
+    except OSError:
+        pass
+
+
+def is_stale(job) -> bool:
+    cutoff = datetime.utcnow() - timedelta(seconds=INGEST_STALE_SECONDS)
+    return (
+        job.status in ("queued", "running") and job.updated_at < cutoff and job.id not in _active
+    )
+
+
+def fail_stale_jobs():
+    """Fail queued/running jobs nobody is working on any more and delete stray spool files."""
+    cutoff = datetime.utcnow() - timedelta(seconds=INGEST_STALE_SECONDS)
+    with _active_lock:
+        mine = list(_active)
+    with SessionLocal() as db:
+        active = IngestJob.status.in_(("queued", "running"))
+        stale = db.query(IngestJob).filter(
+            active, IngestJob.updated_at < cutoff, IngestJob.id.notin_(mine)
+        ).all()
+        for job in stale:
+            job.status = "failed"
+            job.error = "Processing was interrupted, please upload the file again"
+            job.finished_at = datetime.utcnow()
+            ingest_jobs.inc(1, "failed")
+        db.commit()
+        live = {job_id for (job_id,) in db.query(IngestJob.id).filter(active)}
+
+    # Spool files of jobs no longer in flight; recent ones may belong to an
+    # upload whose job row isn't committed yet
+    file_cutoff = time.time() - INGEST_STALE_SECONDS
+    for name in os.listdir(INGEST_UPLOAD_DIR):
+        job_id = name[len("ingest-"):]
+        if not name.startswith("ingest-") or job_id in live:
+            continue
+        try:
+            if os.path.getmtime(os.path.join(INGEST_UPLOAD_DIR, name)) < file_cutoff:
+                _remove_spool(job_id)
+        except OSError:
+            pass
+    return len(stale)
+
+
+_pool = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(max(INGEST_STALE_SECONDS / 4, 1))
+        with _active_lock:
+            job_ids = list(_active)
+        if not job_ids:
+            continue
+        try:
+            with SessionLocal() as db:
+                db.query(IngestJob).filter(
+                    IngestJob.id.in_(job_ids), IngestJob.status.in_(("queued", "running"))
+                ).update({IngestJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+                db.commit()
+        except Exception as e:
+            print("⚠️ Ingest heartbeat failed:", e)
+
+
+def _untrack(job_id: str):
+    with _active_lock:
+        _active.discard(job_id)
+
+
+def submit_job(job_id: str):
+    global _heartbeat
+    with _active_lock:
+        _active.add(job_id)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=_heartbeat_loop, daemon=True, name="ingest-heartbeat")
+            _heartbeat.start()
+    future = _pool.submit(run_job, job_id)
+    future.add_done_callback(lambda _: _untrack(job_id))
@@ -0,0 +1,76 @@
+import math
+import re
+from collections import Counter
+
+import numpy as np
+
+# Words, plus dotted/hyphenated/slashed identifiers kept whole
+# ("e1234", "connection-refused", "app.main", "/generate/stream").
+WORD = re.compile(r"\w+")
+COMPOUND = re.compile(r"\w+(?:[.\-/:]\w+)+")
+# Rough CPython footprint used for nbytes: a new term costs its dict entry and
+# two posting lists; each posting (and doc length) an int plus two list slots.
+TERM_BYTES = 200
+POSTING_BYTES = 44
+
+
+def tokenize(text: str) -> list[str]:
+    text = text.lower()
+    return WORD.findall(text) + COMPOUND.findall(text)
+
+
+class BM25Index:
+    """In-memory inverted index scored with Okapi BM25. Doc ids are positions."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # term -> ([doc ids], [term frequencies])
+        self.doc_lengths = []
+        self.total_length = 0
+        self.nbytes = 0  # estimated memory held by postings and doc_lengths
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, texts):
+        for text in texts:
+            doc_id = len(self.doc_lengths)
+            terms = tokenize(text)
+            counts = Counter(terms)
+            for term, tf in counts.items():
+                if term not in self.postings:
+                    self.postings[term] = ([], [])
+                    self.nbytes += TERM_BYTES + len(term)
+                ids, tfs = self.postings[term]
+                ids.append(doc_id)
+                tfs.append(tf)
+            self.doc_lengths.append(len(terms))
+            self.nbytes += POSTING_BYTES * (len(counts) + 1)
+            self.total_length += len(terms)
+
+    def search(self, query: str, k: int = 4, exclude=()):
+        """Return [(doc_id, score, matched query terms)] best first, skipping `exclude` ids."""
+        n = len(self.doc_lengths)
+        terms = set(tokenize(query))
+        if not n or not terms:
+            return []
+
+        lengths = np.asarray(self.doc_lengths, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / (self.total_length / n))
+        scores = np.zeros(n, dtype=np.float32)
+        matched = np.zeros(n, dtype=np.int32)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids = np.asarray(posting[0])
+            tfs = np.asarray(posting[1], dtype=np.float32)
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm[ids])
+            matched[ids] += 1
+
+        if exclude:
+            scores[np.fromiter(exclude, dtype=np.int64)] = 0
+        top = np.argsort(-scores)[:k]
+        return [(int(i), float(scores[i]), int(matched[i])) for i in top if scores[i] > 0]
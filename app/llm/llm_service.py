@@ -1,32 +1,116 @@
+import asyncio
 import os
-from openai import OpenAI
+import time
+from openai import AsyncOpenAI, RateLimitError
+
+from app.llm.scheduler import LLM_MAX_RETRIES, llm_scheduler, retry_delay
+from app.metrics import (
+    llm_cached_tokens,
+    llm_prompt_tokens,
+    llm_requests,
+    llm_stream_seconds,
+    llm_tokens,
+    llm_tokens_per_second,
+    llm_ttft_seconds,
+)
 
 # Fail fast if key is missing
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY environment variable not set")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+STREAM_ERROR_MESSAGE = "\n⚠️ Error generating response"
+
+# 429 retries go through the scheduler (see _acreate) so it can back off globally
+async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+
+
+def _record_usage(usage, kind: str) -> dict:
+    """Count prompt/cached tokens from an API usage object; returns them as a dict."""
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    llm_prompt_tokens.inc(usage.prompt_tokens, kind)
+    llm_cached_tokens.inc(cached, kind)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": cached,
+        "completion_tokens": usage.completion_tokens,
+    }
 
-def generate_answer(messages: list) -> str:
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages,
-        temperature=0.2
-    )
+async def _acreate(**kwargs):
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        try:
+            response = await async_client.chat.completions.create(**kwargs)
+            llm_scheduler.note_success()
+            return response
+        except RateLimitError as e:
+            delay = retry_delay(e, attempt)
+            llm_scheduler.note_rate_limited(delay)
+            if attempt == LLM_MAX_RETRIES:
+                raise
+            await asyncio.sleep(delay)
+
+async def agenerate_answer(messages: list) -> str:
+    # Background work (history folding): queued fairly, not charged to a user
+    async with llm_scheduler.slot("background", rate_limited=False):
+        try:
+            response = await _acreate(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.2
+            )
+        except Exception:
+            llm_requests.inc(1, "generate", "error")
+            raise
+    llm_requests.inc(1, "generate", "ok")
+    _record_usage(response.usage, "generate")
     return response.choices[0].message.content
-def stream_answer(messages: list):
+
+async def astream_answer(messages: list, usage: dict = None):
+    """Stream answer tokens; the caller holds an llm_scheduler slot.
+
+    If `usage` is given it is filled with the request's token counts and TTFT.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    tokens = 0
     try:
-        stream = client.chat.completions.create(
+        stream = await _acreate(
             model="gpt-4o-mini",
             messages=messages,
             temperature=0.2,
-            stream=True
+            stream=True,
+            stream_options={"include_usage": True}
         )
 
-        for chunk in stream:
-            delta = chunk.choices[0].delta
-            if delta and delta.content:
-                yield delta.content
+        # async with: a cancelled consumer closes the upstream connection too
+        async with stream:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    # Last chunk (include_usage): no choices, just token counts
+                    counts = _record_usage(chunk.usage, "stream")
+                    if usage is not None:
+                        usage.update(counts)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta and delta.content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        llm_ttft_seconds.observe(first_token_at - start)
+                    tokens += 1  # one content delta per token
+                    yield delta.content
+        llm_requests.inc(1, "stream", "ok")
     except Exception:
-        yield "\n⚠️ Error generating response"
+        llm_requests.inc(1, "stream", "error")
+        yield STREAM_ERROR_MESSAGE
+    finally:
+        end = time.perf_counter()
+        llm_stream_seconds.observe(end - start)
+        llm_tokens.inc(tokens)
+        if first_token_at is not None and tokens > 1 and end > first_token_at:
+            llm_tokens_per_second.observe((tokens - 1) / (end - first_token_at))
+        if usage is not None and first_token_at is not None:
+            usage["ttft_ms"] = round((first_token_at - start) * 1000)
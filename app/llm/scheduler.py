@@ -0,0 +1,235 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# Admission control in front of the chat completions API:
+# - at most LLM_MAX_CONCURRENCY upstream calls in flight per process,
+# - a token bucket per user (LLM_USER_RATE requests/s, LLM_USER_BURST burst),
+# - waiting requests are served round-robin across users, and give up after
+#   LLM_QUEUE_TIMEOUT seconds instead of piling up,
+# - an upstream 429 pauses admissions for its Retry-After and halves the
+#   concurrency limit, which then grows back by one per successful call.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_USER_RATE = float(os.getenv("LLM_USER_RATE", "0.5"))  # 0 disables per-user limits
+LLM_USER_BURST = float(os.getenv("LLM_USER_BURST", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+
+# Idle users' buckets are dropped once this many are tracked
+MAX_TRACKED_USERS = 10000
+
+
+class SchedulerRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def retry_delay(error, attempt: int) -> float:
+    """Upstream Retry-After if given, else capped exponential backoff with jitter."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class Lease:
+    """A granted upstream slot; release() is safe to call more than once."""
+
+    def __init__(self, scheduler, wait: float):
+        self.scheduler = scheduler
+        self.wait = wait
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler.release()
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float,
+                 user_rate: float, user_burst: float):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.active = 0
+        self.queued = 0
+        self.resume_at = 0.0
+        self._queues = OrderedDict()  # user -> deque of waiters, in round-robin order
+        self._buckets = {}  # user -> (tokens, last refill)
+        self._resume_handle = None
+        self.admitted = 0
+        self.rate_limited = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.upstream_429 = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    # --- per-user token bucket ---
+    def _take_token(self, user: str) -> float:
+        """Spend one token; returns 0, or seconds until the next token."""
+        if self.user_rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(user, (self.user_burst, now))
+        tokens = min(self.user_burst, tokens + (now - updated) * self.user_rate)
+        if tokens < 1:
+            self._buckets[user] = (tokens, now)
+            return (1 - tokens) / self.user_rate
+        self._buckets[user] = (tokens - 1, now)
+        if len(self._buckets) > MAX_TRACKED_USERS:
+            self._prune_buckets(now)
+        return 0.0
+
+    def _refund_token(self, user: str):
+        # The request was turned away for lack of capacity, not for its rate
+        if self.user_rate <= 0 or user not in self._buckets:
+            return
+        tokens, updated = self._buckets[user]
+        self._buckets[user] = (min(self.user_burst, tokens + 1), updated)
+
+    def _prune_buckets(self, now: float):
+        full = (now - self.user_burst / self.user_rate)
+        self._buckets = {u: b for u, b in self._buckets.items() if b[1] > full}
+
+    # --- admission ---
+    def _can_start(self) -> bool:
+        return self.active < self.limit and time.monotonic() >= self.resume_at
+
+    async def acquire(self, user: str, rate_limited: bool = True) -> Lease:
+        """Wait for an upstream slot, raising SchedulerRejected instead of queueing forever."""
+        if rate_limited:
+            retry_after = self._take_token(user)
+            if retry_after:
+                self.rate_limited += 1
+                raise SchedulerRejected(429, "Too many requests, slow down", retry_after)
+
+        if not self.queued and self._can_start():
+            self.active += 1
+            self.admitted += 1
+            return Lease(self, 0.0)
+
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            if rate_limited:
+                self._refund_token(user)
+            raise SchedulerRejected(503, "Server busy, try again shortly", self.queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append(waiter)
+        self.queued += 1
+        self._dispatch()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(user, waiter)
+            self.timed_out += 1
+            if rate_limited:
+                self._refund_token(user)
+            raise SchedulerRejected(503, "Server busy, try again shortly", self.queue_timeout)
+        except asyncio.CancelledError:
+            # The client went away; hand back a slot granted at the same moment
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._forget(user, waiter)
+            raise
+
+        wait = time.monotonic() - started
+        self.admitted += 1
+        self.wait_seconds += wait
+        self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        return Lease(self, wait)
+
+    def _forget(self, user: str, waiter):
+        queue = self._queues.get(user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self._queues[user]
+
+    def _dispatch(self):
+        delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            if self._queues and self._resume_handle is None:
+                self._resume_handle = asyncio.get_running_loop().call_later(delay, self._resume)
+            return
+        while self._queues and self.active < self.limit:
+            # Oldest waiter of the next user in line; that user moves to the back
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            if waiter.done():
+                continue
+            self.active += 1
+            waiter.set_result(None)
+
+    def _resume(self):
+        self._resume_handle = None
+        self._dispatch()
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user: str, rate_limited: bool = True):
+        lease = await self.acquire(user, rate_limited)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    # --- upstream feedback ---
+    def note_rate_limited(self, delay: float):
+        self.upstream_429 += 1
+        self.limit = max(1, self.limit // 2)
+        self.resume_at = max(self.resume_at, time.monotonic() + delay)
+
+    def note_success(self):
+        if self.limit < self.max_concurrency:
+            self.limit += 1
+            self._dispatch()
+
+    def stats(self):
+        waited = self.admitted or 1
+        return {
+            "active": self.active,
+            "limit": self.limit,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "upstream_429": self.upstream_429,
+            "avg_wait_ms": 1000 * self.wait_seconds / waited,
+            "max_wait_ms": 1000 * self.max_wait_seconds,
+        }
+
+
+llm_scheduler = LLMScheduler(
+    LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT, LLM_USER_RATE, LLM_USER_BURST
+)
@@ -1,38 +1,49 @@
 # main.py
-from datetime import datetime
+import math
 import os
+import shutil
 from typing import List, Optional
 
-from fastapi import FastAPI, Depends, HTTPException, Query, Path, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Path, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import desc
 
 from uuid import uuid4
 
 # --- App & DB ---
-from app.db.database import Base, engine, get_db
+from app.db.database import Base, engine, get_async_db
 
 # --- Auth ---
 from app.auth.auth import router as auth_router
-from app.auth.deps import get_current_user
+from app.auth.deps import get_current_user, token_cache
+from app.auth.hashing import hashing_pool
 
 # --- LLM / RAG / Memory ---
-from app.llm.llm_service import stream_answer
-from app.memory import get_history, save_message
+from app.llm.llm_service import STREAM_ERROR_MESSAGE, astream_answer
+from app.llm.scheduler import SchedulerRejected, llm_scheduler
+from app.memory import get_history_window, has_messages, save_turn, turn_writer
 from app.message_builder import build_messages
-from app.schemas import GenerateRequest,ConversationCreate,ConversationOut,ConversationUpdate,MessageOut,MessagesResponse
+from app.schemas import GenerateRequest,ConversationCreate,ConversationOut,ConversationUpdate,MessageOut,MessagesResponse,IngestJobOut
 from app.prompt_builder import build_system_prompt
-
-from app.file_parser import extract_text
-from app.chunker import chunk_text
-from app.embeddings import embed_texts, embed_query
-from app.rag_store import get_store
+from app.response_cache import RESPONSE_CACHE_ENABLED, replay, response_cache
+
+from app.embedding_cache import embedding_cache
+from app.embeddings import aembed_query
+from app.metrics import METRICS_ENABLED, MetricsMiddleware, register_stats, render, stage
+from app.ownership import aensure_owner, ownership_cache
+from app.rag_store import get_store, store_manager
+from app.retrieval import retrieve, search_batcher
+from app.search import setup_search
+from app.streaming import get_stream, last_event_seq, sse_response, start_stream
+from app.ingest import fail_stale_jobs, is_stale, submit_job, upload_path
+from app.vector_store import INDEX_MODES
 
 # --- Models ---
-from app.db.conversation import Conversation, Message
+from app.db.ingest_job import IngestJob
 from app.routers.conversations import router as conversations_router
 
 app = FastAPI(
@@ -40,14 +51,44 @@ app = FastAPI(
     description="FastAPI + JWT + LLM",
     version="1.0.0"
 )
+app.add_middleware(MetricsMiddleware)
+
+for component, stats in (
+    ("rag_stores", store_manager.stats),
+    ("embedding_cache", embedding_cache.stats),
+    ("response_cache", response_cache.stats),
+    ("llm_scheduler", llm_scheduler.stats),
+    ("password_hashing", hashing_pool.stats),
+    ("token_cache", token_cache.stats),
+    ("ownership_cache", ownership_cache.stats),
+    ("search_batcher", search_batcher.stats),
+):
+    register_stats(component, stats)
 
 @app.on_event("startup")
 async def startup():
     try:
         Base.metadata.create_all(bind=engine)
+        # create_all skips indexes on tables that already exist
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        setup_search(engine)
         print("✅ DB ready")
     except Exception as e:
         print("⚠️ DB issue:", e)
+    try:
+        stale = await run_in_threadpool(fail_stale_jobs)
+        if stale:
+            print(f"⚠️ Marked {stale} interrupted upload jobs as failed")
+    except Exception as e:
+        print("⚠️ Upload job recovery failed:", e)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Don't drop turns still sitting in the write-behind buffer
+    await turn_writer.close()
 
 
 # Routers
@@ -59,127 +100,210 @@ app.include_router(conversations_router)
 def health():
     return {"status": "Application is running"}
 
+# -------------------- Metrics --------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
 # -------------------- Generate (Streaming) --------------------
 @app.post("/generate/stream")
-def generate_stream(
+async def generate_stream(
     payload: GenerateRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
     conversation_id = payload.conversation_id
 
     # Validate conversation ownership
-    convo = (
-        db.query(Conversation)
-        .filter(Conversation.id == conversation_id, Conversation.user_id == current_user)
-        .first()
-    )
-    if not convo:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-
-    # 1) Load persistent chat history
-    history_records = get_history(db, conversation_id)
-    history = [{"role": m.role, "content": m.content} for m in history_records]
-
-    # 2) Build system prompt
-    system_prompt = build_system_prompt(
-        mode=payload.mode,
-        format=payload.format,
-        tone=payload.tone
-    )
+    await aensure_owner(db, current_user, conversation_id)
 
-    # 3) RAG retrieval
-    retrieved_chunks = []
-    store = get_store(current_user, conversation_id)
+    # 1) Admission first, so requests rejected with 429/503 don't pay for the
+    # DB reads, retrieval and embedding calls below
     try:
-        if getattr(store, "index", None) and getattr(store.index, "ntotal", 0) > 0:
-            query_embedding = embed_query(payload.prompt)
-            retrieved_chunks = store.search(query_embedding, k=4)
-    except Exception as e:
-        print("RAG error:", e)
-
-    if retrieved_chunks:
-        system_prompt += "\n\nUse the following context:\n"
-        for i, chunk in enumerate(retrieved_chunks, 1):
-            system_prompt += f"\n[Context {i}]\n{chunk}\n"
-
-    # 4) Build messages for LLM
-    messages = build_messages(
-        system_prompt=system_prompt,
-        history=history,
-        user_prompt=payload.prompt
-    )
+        with stage("queue"):
+            lease = await llm_scheduler.acquire(current_user)
+    except SchedulerRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+
+    try:
+        # 2) Load the recent history window + rolling summary of older turns
+        with stage("history"):
+            summary, history = await get_history_window(db, conversation_id)
+
+        # 3) Build system prompt
+        system_prompt = build_system_prompt(
+            mode=payload.mode,
+            format=payload.format,
+            tone=payload.tone
+        )
+
+        # 4) Hybrid BM25 + vector retrieval (store I/O and search run off the event loop)
+        retrieved_chunks = []
+        query_embedding = None
+        retrieval = "none"
+        try:
+            with stage("retrieval"):
+                store = await run_in_threadpool(get_store, current_user, conversation_id)
+                if store is not None and store.live_count > 0:
+                    retrieved_chunks, query_embedding, retrieval = await retrieve(store, payload.prompt, k=4)
+        except Exception as e:
+            print("RAG error:", e)
+
+        # 5) Response cache: exact, then semantic. Cached answers don't depend on
+        # history, so only stateless (first-turn) prompts are eligible. The window
+        # can be empty on later turns too (trimmed, summary not folded yet), so
+        # look for any stored message instead.
+        cache_status = "off"
+        cached_answer = None
+        cache_key = (system_prompt, "\n\n".join(retrieved_chunks), payload.prompt)
+        if RESPONSE_CACHE_ENABLED and not await has_messages(db, conversation_id):
+            with stage("response_cache"):
+                cached_answer = response_cache.get_exact(*cache_key)
+                cache_status = "hit-exact" if cached_answer is not None else "miss"
+                if cached_answer is None:
+                    try:
+                        if query_embedding is None:
+                            query_embedding = await aembed_query(payload.prompt)
+                        cached_answer = response_cache.get_similar(*cache_key[:2], query_embedding)
+                        if cached_answer is not None:
+                            cache_status = "hit-semantic"
+                    except Exception as e:
+                        print("Response cache error:", e)
+
+        # 6) Build messages for LLM (retrieved context after the history)
+        messages = build_messages(
+            system_prompt=system_prompt,
+            history=history,
+            user_prompt=payload.prompt,
+            summary=summary,
+            context=retrieved_chunks
+        )
+
+        # Reads are done; give the connection back to the pool before streaming
+        await db.close()
+    except BaseException:
+        lease.release()
+        raise
 
-    # 5) Stream response
-    def event_stream():
-        full_answer = ""
+    queue_wait = lease.wait
+    if cached_answer is not None:
+        # Replays don't call upstream; hand the slot back right away
+        lease.release()
+        lease = None
+
+    # 7) Generate in the background (or replay the cached answer) and stream it as SSE
+    usage = {}
+    source = replay(cached_answer) if cached_answer is not None else astream_answer(messages, usage)
+
+    async def finish(full_answer: str, completed: bool):
+        if lease:
+            lease.release()
+        if completed and cache_status == "miss" and not full_answer.endswith(STREAM_ERROR_MESSAGE):
+            response_cache.put(*cache_key, full_answer, embedding=query_embedding)
+        # 8) Save BOTH messages and bump the conversation in one transaction
         try:
-            for token in stream_answer(messages):
-                full_answer += token
-                yield token
-        finally:
-            # 6) Save BOTH messages AFTER streaming completes
-            try:
-                save_message(db, conversation_id, "user", payload.prompt)
-                save_message(db, conversation_id, "assistant", full_answer)
-                # bump conversation timestamp
-                convo.updated_at = datetime.utcnow()
-                db.add(convo)
-                db.commit()
-            except Exception as e:
-                print("⚠️ Failed to persist messages:", e)
-
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+            with stage("persist"):
+                await save_turn(conversation_id, payload.prompt, full_answer)
+        except Exception as e:
+            print("⚠️ Failed to persist messages:", e)
+
+    stream = start_stream(current_user, source, finish, stats=usage)
+    headers = {
+        "X-Response-Cache": cache_status,
+        "X-Retrieval": retrieval,
+        "X-Queue-Wait-Ms": str(round(queue_wait * 1000)),
+    }
+    return sse_response(stream, headers=headers)
+
+
+@app.get("/generate/stream/{stream_id}")
+async def resume_stream(
+    stream_id: str,
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+    current_user: str = Depends(get_current_user)
+):
+    # Reconnect to an answer still generating (or recently finished) on this worker
+    stream = get_stream(stream_id, current_user)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    return sse_response(stream, after=last_event_seq(last_event_id, stream_id))
+
+
+@app.delete("/generate/stream/{stream_id}", status_code=204)
+async def stop_stream(
+    stream_id: str,
+    current_user: str = Depends(get_current_user)
+):
+    stream = get_stream(stream_id, current_user)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    stream.cancel()
+    return None
 
 
 # -------------------- Upload (RAG ingest) --------------------
-@app.post("/upload")
+SUPPORTED_UPLOADS = (".pdf", ".docx", ".txt")
+
+def _save_upload(file: UploadFile, path: str):
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file.file, out, 1024 * 1024)
+
+@app.post("/upload", response_model=IngestJobOut, status_code=202)
 async def upload_file(
     file: UploadFile = File(...),
     conversation_id: str = "",
-    db: Session = Depends(get_db),
+    index_mode: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_user: str = Depends(get_current_user)
 ):
     # Validate conversation ownership
-    convo = (
-        db.query(Conversation)
-        .filter(Conversation.id == conversation_id, Conversation.user_id == current_user)
-        .first()
+    await aensure_owner(db, current_user, conversation_id)
+
+    if not (file.filename or "").endswith(SUPPORTED_UPLOADS):
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    if index_mode and index_mode not in INDEX_MODES:
+        raise HTTPException(status_code=400, detail=f"index_mode must be one of {', '.join(INDEX_MODES)}")
+
+    job = IngestJob(
+        id=str(uuid4()),
+        user_id=current_user,
+        conversation_id=conversation_id,
+        filename=file.filename,
+        index_mode=index_mode,
     )
-    if not convo:
-        raise HTTPException(status_code=404, detail="Conversation not found")
-
     try:
-        content = await file.read()
-        text = extract_text(file.filename, content)
-
-        if not text.strip():
-            raise HTTPException(status_code=400, detail="Empty document")
-
-        chunks = chunk_text(text)
-        embeddings = embed_texts(chunks)
-
-        # Attach to conversation store
-        store = get_store(current_user, conversation_id)
-        store.add(embeddings, chunks)
-
-        # update conversation timestamp
-        convo.updated_at = datetime.utcnow()
-        db.add(convo)
-        db.commit()
-
-        return {
-            "filename": file.filename,
-            "message": "File uploaded and processed successfully",
-            "chunks_stored": len(chunks)
-        }
-    except HTTPException:
-        raise
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        # Spool to disk; parsing, chunking, embedding and indexing run in the background
+        await run_in_threadpool(_save_upload, file, upload_path(job.id))
+        db.add(job)
+        await db.commit()
     except Exception as e:
         print("Upload error:", e)
-        raise HTTPException(status_code=500, detail="Failed to process file")
+        raise HTTPException(status_code=500, detail="Failed to accept file")
+
+    submit_job(job.id)
+    return job
+
+
+@app.get("/upload/jobs/{job_id}", response_model=IngestJobOut)
+async def get_upload_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user)
+):
+    job = await db.get(IngestJob, job_id)
+    if not job or job.user_id != current_user:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if is_stale(job):
+        # Stranded by a restart after startup recovery ran
+        await run_in_threadpool(fail_stale_jobs)
+        await db.refresh(job)
+    return job
 
 
 # -------------------- Static --------------------
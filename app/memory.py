@@ -1,32 +1,260 @@
-from typing import Dict, List, Tuple
+import asyncio
+import os
+from datetime import datetime, timedelta
 
-# Key = (user_id, session_id)
-# Value = list of messages
-from sqlalchemy.orm import Session
-from app.db.conversation import Message
+from sqlalchemy import exists, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.chunker import enc
+from app.db.conversation import Conversation, ConversationSummary, Message
+from app.db.database import AsyncSessionLocal
+from app.llm.llm_service import agenerate_answer
 
+# Only the most recent turns that fit HISTORY_TOKEN_BUDGET are sent to the
+# model; older turns are folded into a stored rolling summary once at least
+# HISTORY_FOLD_TOKENS of them have fallen out of the window.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "100"))
+HISTORY_FOLD_TOKENS = int(os.getenv("HISTORY_FOLD_TOKENS", "1000"))
+# Once over budget the window start advances by at least this many tokens at
+# a time instead of one message per turn, so consecutive prompts keep the
+# same history prefix (and hit the upstream prompt cache) between steps.
+HISTORY_WINDOW_STEP = int(os.getenv("HISTORY_WINDOW_STEP", "1000"))
+
+# With DB_WRITE_BEHIND=1 finished turns are queued and written in batches
+# (one transaction per DB_WRITE_BEHIND_INTERVAL_MS or DB_WRITE_BEHIND_MAX_TURNS)
+# instead of one transaction per turn.
+DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "0") == "1"
+DB_WRITE_BEHIND_INTERVAL_MS = int(os.getenv("DB_WRITE_BEHIND_INTERVAL_MS", "50"))
+DB_WRITE_BEHIND_MAX_TURNS = int(os.getenv("DB_WRITE_BEHIND_MAX_TURNS", "100"))
+
+# Rough per-message overhead of the chat format (role, separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+SUMMARY_PROMPT = """
+You maintain a running summary of a conversation between a user and an AI assistant.
+Update the existing summary with the new messages.
+Keep facts, decisions, names, code identifiers and open questions; drop small talk.
+Reply with the updated summary only, in at most 300 words.
+"""
+
+_STOP = object()
+_folding = set()
+_fold_tasks = set()
+
+
+def count_tokens(content: str) -> int:
+    return len(enc.encode_ordinary(content)) + MESSAGE_TOKEN_OVERHEAD
+
+
+def _window(messages: list, budget: int, step: int = HISTORY_WINDOW_STEP) -> list:
+    """Newest-first messages -> the oldest-first tail that fits the budget."""
+    window = list(reversed(messages))
+    tokens = [count_tokens(msg.content) for msg in window]
+    total, dropped, start, boundary = sum(tokens), 0, 0, 0
+    # Drop whole steps from the front, measured from the oldest message, until the rest fits
+    while total - dropped > budget:
+        boundary += max(step, 1)
+        while start < len(window) and dropped < boundary:
+            dropped += tokens[start]
+            start += 1
+    window = window[start:]
+    # Don't start the window on an assistant reply cut off from its question
+    while window and window[0].role == "assistant":
+        window.pop(0)
+    # An over-budget last exchange would leave the prompt with no context at
+    # all until the fold catches up; keep the newest message (clipped later)
+    if not window and messages:
+        window = [messages[0]]
+    return window
 
-def get_history(db: Session, conversation_id: str):
-    return (
-        db.query(Message)
-        .filter(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at)
-        .all()
-    )
 
+def _clip(content: str, budget: int) -> str:
+    tokens = enc.encode_ordinary(content)
+    return content if len(tokens) <= budget else enc.decode(tokens[:budget])
 
-def save_message(db: Session, conversation_id: str, role: str, content: str):
-    msg = Message(
-        conversation_id=conversation_id,
-        role=role,
-        content=content
+
+async def _recent_window(db: AsyncSession, conversation_id: str, summary, budget: int) -> list:
+    # The newest HISTORY_MAX_MESSAGES rows not yet folded into the summary,
+    # trimmed to the budget. Prompts and folding both use this so the fold
+    # covers exactly what has fallen out of the prompt's window.
+    query = (
+        select(Message)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.desc())
+        .limit(HISTORY_MAX_MESSAGES)
     )
-    db.add(msg)
-    db.commit()
+    if summary and summary.summarized_until:
+        query = query.where(Message.created_at > summary.summarized_until)
+    result = await db.execute(query)
+    return _window(result.scalars().all(), budget)
+
+
+async def has_messages(db: AsyncSession, conversation_id: str) -> bool:
+    """Whether the conversation has any stored message, folded or not."""
+    query = select(exists().where(Message.conversation_id == conversation_id))
+    return bool(await db.scalar(query))
+
+
+async def get_history_window(db: AsyncSession, conversation_id: str, budget: int = HISTORY_TOKEN_BUDGET):
+    """Return (summary, recent messages) for building the next prompt.
+
+    Reads only the newest HISTORY_MAX_MESSAGES rows not yet folded into the
+    summary instead of the whole conversation.
+    """
+    summary = await db.get(ConversationSummary, conversation_id)
+    window = await _recent_window(db, conversation_id, summary, budget)
+    history = [{"role": m.role, "content": m.content} for m in window]
+    if len(history) == 1:
+        # Only _window's fallback message can be over budget by itself
+        history[0]["content"] = _clip(history[0]["content"], budget)
+    return summary.summary if summary else "", history
+
+
+async def fold_history(conversation_id: str, budget: int = HISTORY_TOKEN_BUDGET):
+    if conversation_id in _folding:
+        return
+    _folding.add(conversation_id)
+    try:
+        async with AsyncSessionLocal() as db:
+            summary = await db.get(ConversationSummary, conversation_id)
+            window = await _recent_window(db, conversation_id, summary, budget)
+            # Everything unfolded that is older than the prompt's window
+            query = (
+                select(Message)
+                .where(Message.conversation_id == conversation_id)
+                .order_by(Message.created_at)
+            )
+            if summary and summary.summarized_until:
+                query = query.where(Message.created_at > summary.summarized_until)
+            if window:
+                query = query.where(Message.created_at < window[0].created_at)
+            older = (await db.execute(query)).scalars().all()
+            if sum(count_tokens(m.content) for m in older) < HISTORY_FOLD_TOKENS:
+                return
+
+            transcript = "\n\n".join(f"{m.role}: {m.content}" for m in older)
+            updated = await agenerate_answer([
+                {"role": "system", "content": SUMMARY_PROMPT.strip()},
+                {"role": "user", "content": (
+                    f"Existing summary:\n{summary.summary if summary else '(none)'}"
+                    f"\n\nNew messages:\n{transcript}"
+                )},
+            ])
+
+            if summary is None:
+                summary = ConversationSummary(conversation_id=conversation_id)
+                db.add(summary)
+            summary.summary = updated.strip()
+            summary.summarized_until = older[-1].created_at
+            await db.commit()
+    except Exception as e:
+        print("⚠️ Failed to fold history:", e)
+    finally:
+        _folding.discard(conversation_id)
+
+
+def schedule_fold(conversation_id: str):
+    # Keep a reference so the task isn't garbage collected mid-flight
+    task = asyncio.create_task(fold_history(conversation_id))
+    _fold_tasks.add(task)
+    task.add_done_callback(_fold_tasks.discard)
+
+
+def _turn_rows(conversation_id: str, user_content: str, assistant_content: str):
+    # Explicit timestamps keep the question ordered before its answer
+    now = datetime.utcnow()
+    return [
+        {"conversation_id": conversation_id, "role": "user",
+         "content": user_content, "created_at": now},
+        {"conversation_id": conversation_id, "role": "assistant",
+         "content": assistant_content, "created_at": now + timedelta(microseconds=1)},
+    ]
+
+
+async def _write_turns(turns: list):
+    """Insert every turn's messages and bump the conversations in one transaction."""
+    rows = [row for turn in turns for row in _turn_rows(*turn)]
+    conversation_ids = {turn[0] for turn in turns}
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            await db.execute(insert(Message), rows)
+            await db.execute(
+                update(Conversation)
+                .where(Conversation.id.in_(conversation_ids))
+                .values(updated_at=datetime.utcnow())
+            )
+    for conversation_id in conversation_ids:
+        schedule_fold(conversation_id)
+
+
+class TurnWriter:
+    """Write-behind buffer that batches finished turns across requests."""
+
+    def __init__(self, interval_ms: int = DB_WRITE_BEHIND_INTERVAL_MS, max_turns: int = DB_WRITE_BEHIND_MAX_TURNS):
+        self.interval = interval_ms / 1000
+        self.max_turns = max_turns
+        self.queue = None
+        self.task = None
+
+    def put(self, turn):
+        if self.task is None or self.task.done():
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self._run())
+        self.queue.put_nowait(turn)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            turn = await self.queue.get()
+            if turn is _STOP:
+                return
+            turns = [turn]
+            deadline = loop.time() + self.interval
+            while len(turns) < self.max_turns:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    turn = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if turn is _STOP:
+                    await self._flush(turns)
+                    return
+                turns.append(turn)
+            await self._flush(turns)
+
+    async def _flush(self, turns):
+        try:
+            await _write_turns(turns)
+        except Exception as e:
+            print(f"⚠️ Failed to persist {len(turns)} buffered turns:", e)
+
+    async def close(self):
+        """Stop the writer after everything queued so far, including a batch mid-flush, is written."""
+        if self.task is None:
+            return
+        task, queue = self.task, self.queue
+        self.task = None
+        if not task.done():
+            queue.put_nowait(_STOP)
+            await task
+        turns = []
+        while not queue.empty():
+            turn = queue.get_nowait()
+            if turn is not _STOP:
+                turns.append(turn)
+        if turns:
+            await self._flush(turns)
+
+
+turn_writer = TurnWriter()
 
 
-def clear_history(db: Session, conversation_id: str):
-    db.query(Message)\
-      .filter(Message.conversation_id == conversation_id)\
-      .delete()
-    db.commit()
+async def save_turn(conversation_id: str, user_content: str, assistant_content: str):
+    """Persist a user/assistant exchange on its own session, after the response."""
+    turn = (conversation_id, user_content, assistant_content)
+    if DB_WRITE_BEHIND:
+        turn_writer.put(turn)
+    else:
+        await _write_turns([turn])
@@ -1,4 +1,13 @@
-def build_messages(system_prompt: str, history: list, user_prompt: str):
+def format_context(chunks: list) -> str:
+    context = "Use the following context:\n"
+    for i, chunk in enumerate(chunks, 1):
+        context += f"\n[Context {i}]\n{chunk}\n"
+    return context
+
+
+def build_messages(system_prompt: str, history: list, user_prompt: str, summary: str = "", context: list = None):
+    # Stable parts first (system prompt, summary, history) so consecutive
+    # turns share a prompt prefix upstream; per-turn context goes last.
     messages = []
 
     # system prompt
@@ -7,10 +16,24 @@ def build_messages(system_prompt: str, history: list, user_prompt: str):
         "content": system_prompt
     })
 
+    # rolling summary of turns older than the history window
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{summary}"
+        })
+
     # chat history
     for msg in history:
         messages.append(msg)
 
+    # retrieved context for this prompt only
+    if context:
+        messages.append({
+            "role": "system",
+            "content": format_context(context)
+        })
+
     # current user prompt
     messages.append({
         "role": "user",
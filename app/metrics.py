@@ -0,0 +1,266 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from sqlalchemy import event
+
+# Minimal in-process metrics with Prometheus text output at /metrics.
+# With METRICS_ENABLED=0 every helper below returns before touching a lock
+# or the clock, so instrumented code pays one attribute check.
+# SERVER_TIMING=1 additionally reports each request's stages in a
+# Server-Timing response header.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SERVER_TIMING = METRICS_ENABLED and os.getenv("SERVER_TIMING", "0") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+
+_NOOP = nullcontext()
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _escape(value) -> str:
+    # Text exposition format: backslash, double quote and newline are escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            for labels, value in self._values.items():
+                yield f"{self.name}{_label_text(self.labels, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        if not METRICS_ENABLED:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def time(self, *labels):
+        """Context manager observing the wall time of its block."""
+        if not METRICS_ENABLED:
+            return _NOOP
+        return _timer(self, labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-1]):
+                cumulative += count
+                label_text = _label_text(self.labels + ("le",), labels + (bound,))
+                yield f"{self.name}_bucket{label_text} {cumulative}"
+            label_text = _label_text(self.labels, labels)
+            yield f"{self.name}_sum{label_text} {values[-1]}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+@contextmanager
+def _timer(histogram, labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+_metrics = []
+_collectors = {}
+
+
+def counter(name, help, labels=()):
+    metric = Counter(name, help, labels)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, help, labels, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def register_stats(component: str, stats):
+    """Export a component's stats() dict as app_<component>_<key> gauges at scrape time."""
+    _collectors[component] = stats
+
+
+# --- request stages (Server-Timing) ---
+stage_seconds = histogram("app_stage_seconds", "Time spent in each request stage", ("stage",))
+
+
+@contextmanager
+def _stage_timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def stage(name: str):
+    """Time a named stage of the current request (histogram + Server-Timing)."""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _stage_timer(name)
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for component, stats in _collectors.items():
+        try:
+            values = stats()
+        except Exception as e:
+            print(f"⚠️ Metrics: {component} stats failed:", e)
+            continue
+        for key, value in values.items():
+            if isinstance(value, (int, float)):
+                name = f"app_{component}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- HTTP middleware ---
+http_requests = counter("app_http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_seconds = histogram(
+    "app_http_request_seconds", "Time to response headers", ("method", "route")
+)
+
+
+class MetricsMiddleware:
+    """Counts requests, times them to the response start, and adds Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not METRICS_ENABLED or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        timings = [] if SERVER_TIMING else None
+        token = _request_timings.set(timings)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - start
+                route = getattr(scope.get("route"), "path", "unmatched")
+                http_requests.inc(1, scope["method"], route, message["status"])
+                http_seconds.observe(elapsed, scope["method"], route)
+                if timings:
+                    value = ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings)
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"server-timing", value.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_timings.reset(token)
+
+
+# --- database ---
+db_query_seconds = histogram("app_db_query_seconds", "Database statement execution time", ("engine",))
+
+
+def instrument_engine(engine, name: str):
+    if not METRICS_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        db_query_seconds.observe(time.perf_counter() - conn.info["query_start"].pop(), name)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("query_start") if context.connection else None
+        if starts:
+            starts.pop()
+        db_errors.inc(1, name)
+
+
+db_errors = counter("app_db_errors_total", "Failed database statements", ("engine",))
+
+# --- embeddings ---
+embedding_request_seconds = histogram("app_embedding_request_seconds", "Embeddings API call time", ("kind",))
+embedding_inputs = counter("app_embedding_inputs_total", "Texts sent to the embeddings API", ("kind",))
+embedding_retries = counter("app_embedding_retries_total", "Retried embeddings API calls")
+
+# --- retrieval ---
+retrieval_requests = counter("app_retrieval_requests_total", "Retrievals by path taken", ("path",))
+search_seconds = histogram("app_search_seconds", "Index search time", ("index",))
+
+# --- LLM ---
+llm_ttft_seconds = histogram("app_llm_ttft_seconds", "Time to first streamed token")
+llm_stream_seconds = histogram("app_llm_stream_seconds", "Total streamed answer time")
+llm_tokens_per_second = histogram(
+    "app_llm_tokens_per_second", "Streaming rate after the first token", buckets=RATE_BUCKETS
+)
+llm_tokens = counter("app_llm_tokens_total", "Streamed completion tokens")
+llm_requests = counter("app_llm_requests_total", "Chat completion calls", ("kind", "outcome"))
+llm_prompt_tokens = counter("app_llm_prompt_tokens_total", "Prompt tokens billed", ("kind",))
+llm_cached_tokens = counter(
+    "app_llm_cached_prompt_tokens_total", "Prompt tokens served from the upstream prefix cache", ("kind",)
+)
+
+# --- uploads ---
+ingest_stage_seconds = histogram("app_ingest_stage_seconds", "Upload pipeline stage time", ("stage",))
+ingest_jobs = counter("app_ingest_jobs_total", "Finished upload jobs", ("status",))
+ingest_chunks = counter("app_ingest_chunks_total", "Chunks indexed from uploads")
+ingest_chunks_reused = counter("app_ingest_chunks_reused_total", "Upload chunks already in the store")
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db.conversation import Conversation
+
+# Remembers which (user, conversation) pairs were confirmed to exist, so the
+# per-request ownership check doesn't hit the database every time. Entries are
+# added on create and dropped on delete; the TTL bounds staleness across workers.
+OWNERSHIP_CACHE_TTL = float(os.getenv("OWNERSHIP_CACHE_TTL", "60"))
+OWNERSHIP_CACHE_MAX_ENTRIES = int(os.getenv("OWNERSHIP_CACHE_MAX_ENTRIES", "50000"))
+
+
+class OwnershipCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user, conversation_id) -> expires_at
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def check(self, user: str, conversation_id: str) -> bool:
+        key = (user, conversation_id)
+        with self._lock:
+            expires_at = self._entries.get(key)
+            if expires_at is not None and expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self._entries.pop(key, None)
+            self.misses += 1
+            return False
+
+    def add(self, user: str, conversation_id: str):
+        key = (user, conversation_id)
+        with self._lock:
+            self._entries[key] = time.time() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, user: str, conversation_id: str):
+        with self._lock:
+            self._entries.pop((user, conversation_id), None)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+ownership_cache = OwnershipCache(OWNERSHIP_CACHE_TTL, OWNERSHIP_CACHE_MAX_ENTRIES)
+
+
+def _owner_query(user: str, conversation_id: str):
+    return select(Conversation.id).where(
+        Conversation.id == conversation_id, Conversation.user_id == user
+    )
+
+
+def ensure_owner(db: Session, user: str, conversation_id: str):
+    if ownership_cache.check(user, conversation_id):
+        return
+    if db.execute(_owner_query(user, conversation_id)).first() is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    ownership_cache.add(user, conversation_id)
+
+
+async def aensure_owner(db: AsyncSession, user: str, conversation_id: str):
+    if ownership_cache.check(user, conversation_id):
+        return
+    if (await db.execute(_owner_query(user, conversation_id))).first() is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    ownership_cache.add(user, conversation_id)
@@ -0,0 +1,26 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+
+# Keyset cursors: the sort key of the last row on a page, encoded so clients
+# treat it as an opaque token and just hand it back for the next page.
+
+
+def encode_cursor(key, row_id: str) -> str:
+    """key is the sort value of the last row: a datetime or a number (e.g. a rank)."""
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = json.dumps([key, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, key_type=datetime):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key, row_id = json.loads(raw)
+        key = datetime.fromisoformat(key) if key_type is datetime else key_type(key)
+        return key, str(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
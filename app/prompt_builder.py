@@ -1,48 +1,70 @@
-def build_system_prompt(
-    mode: str,
-    format: str,
-    tone: str
-) -> str:
-    prompt = """
+from itertools import product
+
+# System prompts are static per (mode, format, tone), so every combination is
+# built once at import and requests get the identical string back. Keeping the
+# first message byte-for-byte stable lets upstream prompt-prefix caching hit;
+# per-request content (retrieved context) goes at the end of the conversation.
+BASE_PROMPT = """
 You are a highly capable AI assistant.
 Follow all instructions strictly.
 Use Markdown formatting.
 """
 
-    # 🎯 MODE CONTROL
-    if mode == "coding":
-        prompt += """
+# 🎯 MODE CONTROL
+MODE_PROMPTS = {
+    "coding": """
 You are a senior software engineer.
 - Provide correct, production-quality code
 - Explain logic briefly
 - Use code blocks
-"""
-    elif mode == "interview":
-        prompt += """
+""",
+    "interview": """
 You are an interview preparation assistant.
 - Give clear, structured answers
 - Highlight key points
 - Be concise
-"""
-    elif mode == "explainer":
-        prompt += """
+""",
+    "explainer": """
 You explain concepts to beginners.
 - Use simple language
 - Give examples
-"""
+""",
+}
+
+# 🧾 FORMAT CONTROL
+FORMAT_PROMPTS = {
+    "bullets": "\nAlways respond using bullet points.",
+    "table": "\nAlways respond using markdown tables.",
+    "json": "\nRespond ONLY in valid JSON. Do not include explanations.",
+}
 
-    # 🧾 FORMAT CONTROL
-    if format == "bullets":
-        prompt += "\nAlways respond using bullet points."
-    elif format == "table":
-        prompt += "\nAlways respond using markdown tables."
-    elif format == "json":
-        prompt += "\nRespond ONLY in valid JSON. Do not include explanations."
+# 🎭 TONE CONTROL
+TONE_PROMPTS = {
+    "simple": "\nKeep explanations very simple.",
+    "detailed": "\nProvide detailed explanations.",
+}
 
-    # 🎭 TONE CONTROL
-    if tone == "simple":
-        prompt += "\nKeep explanations very simple."
-    elif tone == "detailed":
-        prompt += "\nProvide detailed explanations."
 
+def _compose(mode, format, tone) -> str:
+    prompt = BASE_PROMPT + MODE_PROMPTS.get(mode, "") + FORMAT_PROMPTS.get(format, "") + TONE_PROMPTS.get(tone, "")
     return prompt.strip()
+
+
+# None stands for any value without instructions of its own ("default", "normal", ...)
+SYSTEM_PROMPTS = {
+    key: _compose(*key)
+    for key in product([None, *MODE_PROMPTS], [None, *FORMAT_PROMPTS], [None, *TONE_PROMPTS])
+}
+
+
+def build_system_prompt(
+    mode: str,
+    format: str,
+    tone: str
+) -> str:
+    key = (
+        mode if mode in MODE_PROMPTS else None,
+        format if format in FORMAT_PROMPTS else None,
+        tone if tone in TONE_PROMPTS else None,
+    )
+    return SYSTEM_PROMPTS[key]
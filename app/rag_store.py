@@ -1,9 +1,98 @@
-from app.vector_store import VectorStore
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
 
-stores = {}
+from app.vector_store import VectorStore, has_store
 
-def get_store(user: str, conversation_id: str):
-    key = (user, conversation_id)
-    if key not in stores:
-        stores[key] = VectorStore()
-    return stores[key]
+# Each (user, conversation) gets its own directory of versioned, memory-mapped
+# index files, so restarts are cheap and workers share pages via the OS cache.
+RAG_STORE_DIR = os.getenv("RAG_STORE_DIR", "data/rag_stores")
+
+# Residency budget for open stores; evicted stores are simply reopened from disk
+RAG_MAX_STORES = int(os.getenv("RAG_MAX_STORES", "256"))
+RAG_MAX_RESIDENT_BYTES = int(os.getenv("RAG_MAX_RESIDENT_BYTES", str(1024 * 1024 * 1024)))
+
+
+def store_path(user: str, conversation_id: str) -> str:
+    key = hashlib.sha256(f"{user}\0{conversation_id}".encode("utf-8")).hexdigest()
+    return os.path.join(RAG_STORE_DIR, key[:2], key)
+
+
+class StoreManager:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user: str, conversation_id: str, create: bool = False, mode: str | None = None):
+        key = (user, conversation_id)
+        with self._lock:
+            store = self._stores.get(key)
+            if store is not None:
+                self._stores.move_to_end(key)
+                self.hits += 1
+                # BM25 indexes grow after the store is cached, so recheck the budget
+                self._evict()
+            else:
+                self.misses += 1
+
+        if store is not None:
+            # pick up versions written by other workers
+            store.refresh()
+            return store
+
+        path = store_path(user, conversation_id)
+        # Conversations without documents never get a store
+        if not create and not has_store(path):
+            return None
+
+        store = VectorStore(path=path, mode=mode)
+        with self._lock:
+            store = self._stores.setdefault(key, store)
+            self._stores.move_to_end(key)
+            self._evict()
+        return store
+
+    def _evict(self):
+        # Everything is already persisted on add, so eviction only drops the
+        # mapping; the most recently used store is always kept.
+        while len(self._stores) > 1 and (
+            len(self._stores) > self.max_entries or self._resident_bytes() > self.max_bytes
+        ):
+            self._stores.popitem(last=False)
+            self.evictions += 1
+
+    def _resident_bytes(self) -> int:
+        return sum(store.resident_bytes for store in self._stores.values())
+
+    def release(self, user: str, conversation_id: str):
+        with self._lock:
+            self._stores.pop((user, conversation_id), None)
+        shutil.rmtree(store_path(user, conversation_id), ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "stores": len(self._stores),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "resident_bytes": self._resident_bytes(),
+            }
+
+
+store_manager = StoreManager(RAG_MAX_STORES, RAG_MAX_RESIDENT_BYTES)
+
+
+def get_store(user: str, conversation_id: str, create: bool = False, mode: str | None = None):
+    return store_manager.get(user, conversation_id, create=create, mode=mode)
+
+
+def release_store(user: str, conversation_id: str):
+    store_manager.release(user, conversation_id)
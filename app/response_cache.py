@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Opt-in cache of full answers, keyed on (system prompt, retrieved context,
+# prompt). Exact matches are tried first, then the most similar cached prompt
+# with the same system prompt and context.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "0") == "1"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Size of the pieces a cached answer is replayed in
+RESPONSE_CACHE_REPLAY_CHARS = 32
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("answer", "partition", "embedding", "expires_at")
+
+    def __init__(self, answer, partition, embedding, expires_at):
+        self.answer = answer
+        self.partition = partition
+        self.embedding = embedding
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int, ttl: float, similarity: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        self._partitions = {}  # partition -> {key: embedding}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def keys(system_prompt: str, context: str, prompt: str):
+        partition = _digest(system_prompt, context)
+        return partition, _digest(partition, " ".join(prompt.split()))
+
+    def get_exact(self, system_prompt: str, context: str, prompt: str) -> str | None:
+        _, key = self.keys(system_prompt, context, prompt)
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry.answer
+
+    def get_similar(self, system_prompt: str, context: str, embedding) -> str | None:
+        partition, _ = self.keys(system_prompt, context, "")
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            candidates = [
+                (key, vector)
+                # list(): _live() drops expired entries from this dict
+                for key, vector in list(self._partitions.get(partition, {}).items())
+                if self._live(key) is not None
+            ]
+            if candidates:
+                matrix = np.stack([vector for _, vector in candidates])
+                scores = matrix @ query / (
+                    np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12
+                )
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity:
+                    key = candidates[best][0]
+                    self._entries.move_to_end(key)
+                    self.semantic_hits += 1
+                    return self._entries[key].answer
+            self.misses += 1
+            return None
+
+    def put(self, system_prompt: str, context: str, prompt: str, answer: str, embedding=None):
+        partition, key = self.keys(system_prompt, context, prompt)
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = _Entry(answer, partition, embedding, time.monotonic() + self.ttl)
+            if embedding is not None:
+                self._partitions.setdefault(partition, {})[key] = embedding
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at < time.monotonic():
+            self._drop(key)
+            return None
+        return entry
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        vectors = self._partitions.get(entry.partition)
+        if vectors is not None:
+            vectors.pop(key, None)
+            if not vectors:
+                del self._partitions[entry.partition]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+            }
+
+
+async def replay(answer: str):
+    for start in range(0, len(answer), RESPONSE_CACHE_REPLAY_CHARS):
+        yield answer[start:start + RESPONSE_CACHE_REPLAY_CHARS]
+
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIMILARITY)
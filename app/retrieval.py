@@ -0,0 +1,153 @@
+import asyncio
+import os
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.embeddings import aembed_query
+from app.lexical_index import tokenize
+from app.metrics import retrieval_requests, search_seconds, stage
+
+# Hybrid retrieval: BM25 and vector results merged with reciprocal rank
+# fusion. Short queries that BM25 answers confidently (every query term in
+# the top chunk, clearly ahead of the runner-up) skip the embedding call.
+RRF_K = int(os.getenv("RETRIEVAL_RRF_K", "60"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+LEXICAL_FAST_PATH = os.getenv("RETRIEVAL_LEXICAL_FAST_PATH", "1") == "1"
+LEXICAL_FAST_PATH_MAX_TERMS = int(os.getenv("RETRIEVAL_LEXICAL_MAX_TERMS", "6"))
+LEXICAL_FAST_PATH_MARGIN = float(os.getenv("RETRIEVAL_LEXICAL_MARGIN", "1.5"))
+# Vector searches against the same store version run as one batched index
+# search (at most RETRIEVAL_BATCH_MAX queries; 1 turns batching off). While
+# another batch is running, new searches wait up to RETRIEVAL_BATCH_WINDOW_MS
+# for company; otherwise only those arriving in the same event-loop tick are
+# grouped, so a lone request isn't delayed.
+RETRIEVAL_BATCH_WINDOW_MS = float(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "2"))
+RETRIEVAL_BATCH_MAX = int(os.getenv("RETRIEVAL_BATCH_MAX", "32"))
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K):
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def lexically_confident(query: str, lexical) -> bool:
+    terms = set(tokenize(query))
+    if not lexical or not terms or len(terms) > LEXICAL_FAST_PATH_MAX_TERMS:
+        return False
+    _, top_score, matched = lexical[0]
+    if matched < len(terms):
+        return False
+    runner_up = lexical[1][1] if len(lexical) > 1 else 0.0
+    return top_score >= LEXICAL_FAST_PATH_MARGIN * runner_up
+
+
+class _Batch:
+    __slots__ = ("store", "snapshot", "items", "timer")
+
+    def __init__(self, store, snapshot):
+        self.store = store
+        self.snapshot = snapshot
+        self.items = []  # (query embedding, k, future)
+        self.timer = None
+
+
+class SearchBatcher:
+    """Coalesces concurrent vector searches per store version into one index.search."""
+
+    def __init__(self, window_ms: float, max_batch: int):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending = {}  # id(snapshot) -> _Batch; the batch keeps the snapshot alive
+        self._tasks = set()
+        self._running = 0
+        self.batches = 0
+        self.queries = 0
+        self.max_batch_seen = 0
+
+    async def search(self, store, query_embedding, k: int, snapshot=None):
+        snapshot = snapshot or store.snapshot
+        if self.max_batch <= 1:
+            self._count(1)
+            return await run_in_threadpool(store.search_ids, query_embedding, k, snapshot)
+
+        loop = asyncio.get_running_loop()
+        key = id(snapshot)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = _Batch(store, snapshot)
+            delay = self.window if self._running else 0
+            batch.timer = loop.call_later(delay, self._flush, key)
+        future = loop.create_future()
+        batch.items.append((query_embedding, k, future))
+        if len(batch.items) >= self.max_batch:
+            batch.timer.cancel()
+            self._flush(key)
+        return await future
+
+    def _flush(self, key):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self._count(len(batch.items))
+        queries = np.array([query for query, _, _ in batch.items], dtype="float32")
+        k = max(k for _, k, _ in batch.items)
+        self._running += 1
+        try:
+            results = await run_in_threadpool(batch.store.search_ids_batch, queries, k, batch.snapshot)
+        except Exception as e:
+            for _, _, future in batch.items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._running -= 1
+        for (_, k, future), ids in zip(batch.items, results):
+            # The request may have been cancelled while waiting
+            if not future.done():
+                future.set_result(ids[:k])
+
+    def _count(self, n: int):
+        self.batches += 1
+        self.queries += n
+        self.max_batch_seen = max(self.max_batch_seen, n)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch": self.queries / self.batches if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "pending": sum(len(batch.items) for batch in self._pending.values()),
+        }
+
+
+search_batcher = SearchBatcher(RETRIEVAL_BATCH_WINDOW_MS, RETRIEVAL_BATCH_MAX)
+
+
+async def retrieve(store, query: str, k: int = 4):
+    """Return (chunks, query embedding or None, "lexical" | "hybrid")."""
+    # One version for both searches: compaction may renumber chunk ids
+    snapshot = store.snapshot
+    texts = snapshot[1]
+    with search_seconds.time("lexical"):
+        lexical = await run_in_threadpool(store.lexical_search, query, RETRIEVAL_CANDIDATES, snapshot)
+
+    if LEXICAL_FAST_PATH and lexically_confident(query, lexical):
+        retrieval_requests.inc(1, "lexical")
+        return [texts[doc_id] for doc_id, _, _ in lexical[:k]], None, "lexical"
+
+    retrieval_requests.inc(1, "hybrid")
+    with stage("embed_query"):
+        query_embedding = await aembed_query(query)
+    with search_seconds.time("vector"):
+        vector_ids = await search_batcher.search(store, query_embedding, RETRIEVAL_CANDIDATES, snapshot)
+    fused = reciprocal_rank_fusion([[doc_id for doc_id, _, _ in lexical], vector_ids])
+    return [texts[doc_id] for doc_id in fused[:k]], query_embedding, "hybrid"
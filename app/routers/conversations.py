@@ -3,17 +3,23 @@ from uuid import uuid4
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, tuple_
 
 from app.auth.deps import get_current_user
 from app.db.database import get_db
 from app.db.conversation import Conversation, Message
+from app.ownership import ensure_owner, ownership_cache
+from app.pagination import decode_cursor, encode_cursor
+from app.rag_store import get_store, release_store
+from app.search import search_conversations
 from app.schemas import (
     ConversationOut,
     ConversationUpdate,
+    DocumentOut,
     MessagesResponse,
+    SearchResponse,
 )
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
@@ -51,13 +57,16 @@ def create_conversation(
     db.add(convo)
     db.commit()
     db.refresh(convo)
+    ownership_cache.add(current_user, convo.id)
     return convo
 
 @router.get("", response_model=list[ConversationOut])
 def list_conversations(
+    response: Response,
     query: Optional[str] = Query(default=None, description="Search by title"),
     limit: int = Query(default=50, ge=1, le=200),
-    offset: int = Query(default=0, ge=0),
+    offset: int = Query(default=0, ge=0, description="Deprecated: use cursor"),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor from the previous page"),
     db: Session = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
@@ -68,32 +77,95 @@ def list_conversations(
             q = q.filter(Conversation.title.ilike(f"%{query}%"))  # type: ignore[attr-defined]
         except Exception:
             q = q.filter(Conversation.title.like(f"%{query}%"))
-    convos = (
-        q.order_by(desc(Conversation.updated_at), desc(Conversation.created_at))
-         .offset(offset)
-         .limit(limit)
-         .all()
-    )
+    if cursor:
+        # Keyset: continue strictly after the last row of the previous page
+        updated_at, last_id = decode_cursor(cursor)
+        q = q.filter(tuple_(Conversation.updated_at, Conversation.id) < (updated_at, last_id))
+    q = q.order_by(desc(Conversation.updated_at), desc(Conversation.id))
+    if not cursor and offset:
+        q = q.offset(offset)
+    convos = q.limit(limit + 1).all()
+    if len(convos) > limit:
+        convos = convos[:limit]
+        # This endpoint has always returned a bare array, so the cursor goes in
+        # a header to keep that body shape; endpoints that already return an
+        # object (messages, search) carry next_cursor in the body instead.
+        response.headers["X-Next-Cursor"] = encode_cursor(convos[-1].updated_at, convos[-1].id)
     return convos
 
+@router.get("/search", response_model=SearchResponse)
+def search(
+    q: str = Query(..., min_length=1, description="Words to find in titles and messages"),
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    after = decode_cursor(cursor, float) if cursor else None
+    try:
+        rows = search_conversations(db, current_user, q, limit + 1, after)
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["score"], rows[-1]["ref_id"])
+    results = [
+        {**row, "message_id": row["ref_id"] if row["kind"] == "message" else None}
+        for row in rows
+    ]
+    return {"results": results, "next_cursor": next_cursor}
+
 @router.get("/{conversation_id}/messages", response_model=MessagesResponse)
 def get_conversation_messages(
     conversation_id: str = Path(...),
     limit: int = Query(default=200, ge=1, le=1000),
-    offset: int = Query(default=0, ge=0),
+    offset: int = Query(default=0, ge=0, description="Deprecated: use cursor"),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
     db: Session = Depends(get_db),
     current_user: str = Depends(get_current_user)
 ):
-    _ = _get_user_conversation_or_404(db, current_user, conversation_id)
-    msgs = (
+    ensure_owner(db, current_user, conversation_id)
+    q = (
         db.query(Message)
         .filter(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at.asc())
-        .offset(offset)
-        .limit(limit)
-        .all()
+        .order_by(Message.created_at.asc(), Message.id.asc())
     )
-    return {"messages": msgs}
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        q = q.filter(tuple_(Message.created_at, Message.id) > (created_at, last_id))
+    elif offset:
+        q = q.offset(offset)
+    msgs = q.limit(limit + 1).all()
+    next_cursor = None
+    if len(msgs) > limit:
+        msgs = msgs[:limit]
+        next_cursor = encode_cursor(msgs[-1].created_at, msgs[-1].id)
+    return {"messages": msgs, "next_cursor": next_cursor}
+
+@router.get("/{conversation_id}/documents", response_model=list[DocumentOut])
+def list_documents(
+    conversation_id: str,
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    ensure_owner(db, current_user, conversation_id)
+    store = get_store(current_user, conversation_id)
+    return store.documents() if store is not None else []
+
+@router.delete("/{conversation_id}/documents/{document_id}", status_code=204)
+def delete_document(
+    conversation_id: str,
+    document_id: str,
+    db: Session = Depends(get_db),
+    current_user: str = Depends(get_current_user)
+):
+    ensure_owner(db, current_user, conversation_id)
+    store = get_store(current_user, conversation_id)
+    if store is None or not store.remove_document(document_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return None
 
 @router.patch("/{conversation_id}", response_model=ConversationOut)
 def rename_conversation(
@@ -119,4 +191,6 @@ def delete_conversation(
     convo = _get_user_conversation_or_404(db, current_user, conversation_id)
     db.delete(convo)
     db.commit()
+    ownership_cache.discard(current_user, conversation_id)
+    release_store(current_user, conversation_id)
     return None
\ No newline at end of file
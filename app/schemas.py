@@ -47,5 +47,41 @@ class MessageOut(BaseModel):
 
 class MessagesResponse(BaseModel):
     messages: List[MessageOut]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
 
+class SearchHit(BaseModel):
+    kind: str                  # "message" | "title"
+    conversation_id: str
+    title: Optional[str] = None
+    message_id: Optional[str] = None
+    role: Optional[str] = None
+    snippet: str               # matched terms wrapped in [ ]
+    created_at: Optional[datetime] = None
+    score: float               # lower is better
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+    next_cursor: Optional[str] = None
+
+class DocumentOut(BaseModel):
+    id: str
+    name: str
+    sha256: str
+    chunks: int
+    added_at: datetime
 
+class IngestJobOut(BaseModel):
+    job_id: str = Field(validation_alias="id")
+    conversation_id: str
+    filename: str
+    status: str
+    stage: Optional[str] = None
+    chunks_total: Optional[int] = None
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,155 @@
+import os
+import re
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Full-text search over conversation titles and message bodies.
+# SQLite: external-content FTS5 tables kept in sync by triggers.
+# Postgres: generated tsvector columns with GIN indexes.
+# Either way every insert/update/delete of a message (save_turn's bulk insert
+# included) updates the index in the same transaction.
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")  # Postgres text search config
+SNIPPET_WORDS = 16
+
+WORD = re.compile(r"\w+")
+
+SQLITE_SETUP = [
+    "CREATE VIRTUAL TABLE messages_fts USING fts5(content, content='messages', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE VIRTUAL TABLE conversations_fts USING fts5(title, content='conversations', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')",
+    """CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.rowid, new.content);
+    END""",
+    """CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END""",
+    """CREATE TRIGGER messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.rowid, new.content);
+    END""",
+    """CREATE TRIGGER conversations_fts_ai AFTER INSERT ON conversations BEGIN
+        INSERT INTO conversations_fts(rowid, title) VALUES (new.rowid, coalesce(new.title, ''));
+    END""",
+    """CREATE TRIGGER conversations_fts_ad AFTER DELETE ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.rowid, coalesce(old.title, ''));
+    END""",
+    """CREATE TRIGGER conversations_fts_au AFTER UPDATE OF title ON conversations BEGIN
+        INSERT INTO conversations_fts(conversations_fts, rowid, title) VALUES ('delete', old.rowid, coalesce(old.title, ''));
+        INSERT INTO conversations_fts(rowid, title) VALUES (new.rowid, coalesce(new.title, ''));
+    END""",
+    # Index rows written before search existed
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+    "INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_SETUP = [
+    """ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{config}', coalesce(content, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search ON messages USING GIN (search_vector)",
+    """ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('{config}', coalesce(title, ''))) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_conversations_search ON conversations USING GIN (search_vector)",
+]
+
+# Lower score = better match on both backends (FTS5 bm25() is negative)
+SQLITE_QUERY = """
+SELECT * FROM (
+    SELECT 'message' AS kind, m.id AS ref_id, m.conversation_id AS conversation_id,
+           c.title AS title, m.role AS role, m.created_at AS created_at,
+           snippet(messages_fts, 0, '[', ']', '…', :words) AS snippet,
+           bm25(messages_fts) AS score
+    FROM messages_fts
+    JOIN messages m ON m.rowid = messages_fts.rowid
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE messages_fts MATCH :query AND c.user_id = :user_id
+    UNION ALL
+    SELECT 'title', c.id, c.id, c.title, NULL, c.updated_at,
+           snippet(conversations_fts, 0, '[', ']', '…', :words),
+           bm25(conversations_fts)
+    FROM conversations_fts
+    JOIN conversations c ON c.rowid = conversations_fts.rowid
+    WHERE conversations_fts MATCH :query AND c.user_id = :user_id
+) AS hits
+WHERE :after_score IS NULL OR score > :after_score OR (score = :after_score AND ref_id > :after_id)
+ORDER BY score, ref_id
+LIMIT :limit
+"""
+
+POSTGRES_QUERY = """
+WITH q AS (SELECT websearch_to_tsquery(CAST(:config AS regconfig), :query) AS query)
+SELECT page.kind, page.ref_id, page.conversation_id, page.title, page.role, page.created_at,
+       ts_headline(CAST(:config AS regconfig), page.body, q.query,
+                   'StartSel=[, StopSel=], MaxFragments=1, MaxWords=' || :words) AS snippet,
+       page.score
+FROM (
+    SELECT * FROM (
+        SELECT 'message' AS kind, m.id AS ref_id, m.conversation_id AS conversation_id,
+               c.title AS title, m.role AS role, m.created_at AS created_at, m.content AS body,
+               -ts_rank_cd(m.search_vector, q.query) AS score
+        FROM messages m CROSS JOIN q
+        JOIN conversations c ON c.id = m.conversation_id
+        WHERE m.search_vector @@ q.query AND c.user_id = :user_id
+        UNION ALL
+        SELECT 'title', c.id, c.id, c.title, NULL, c.updated_at, coalesce(c.title, ''),
+               -ts_rank_cd(c.search_vector, q.query)
+        FROM conversations c CROSS JOIN q
+        WHERE c.search_vector @@ q.query AND c.user_id = :user_id
+    ) AS hits
+    WHERE CAST(:after_score AS float8) IS NULL OR score > :after_score OR (score = :after_score AND ref_id > :after_id)
+    ORDER BY score, ref_id
+    LIMIT :limit
+) AS page CROSS JOIN q
+ORDER BY page.score, page.ref_id
+"""
+
+
+def search_backend(engine) -> str | None:
+    name = engine.dialect.name
+    return name if name in ("sqlite", "postgresql") else None
+
+
+def setup_search(engine):
+    """Create the full-text index for this database if it doesn't exist yet."""
+    backend = search_backend(engine)
+    if backend == "sqlite":
+        with engine.begin() as conn:
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+            )).first()
+            if not exists:
+                for statement in SQLITE_SETUP:
+                    conn.execute(text(statement))
+    elif backend == "postgresql":
+        if not re.fullmatch(r"\w+", SEARCH_LANGUAGE):
+            raise ValueError(f"Invalid SEARCH_LANGUAGE: {SEARCH_LANGUAGE!r}")
+        with engine.begin() as conn:
+            for statement in POSTGRES_SETUP:
+                conn.execute(text(statement.format(config=SEARCH_LANGUAGE)))
+
+
+def _fts5_query(query: str) -> str:
+    # Quote every word so user input can't hit FTS5 query syntax; words are ANDed
+    return " ".join(f'"{word}"' for word in WORD.findall(query))
+
+
+def search_conversations(db: Session, user_id: str, query: str, limit: int, after=None):
+    """Ranked title/message hits for a user; after is (score, ref_id) of the previous page's last hit."""
+    backend = search_backend(db.get_bind())
+    params = {
+        "user_id": user_id,
+        "limit": limit,
+        "words": SNIPPET_WORDS,
+        "after_score": after[0] if after else None,
+        "after_id": after[1] if after else None,
+    }
+    if backend == "sqlite":
+        params["query"] = _fts5_query(query)
+        if not params["query"]:
+            return []
+        sql = SQLITE_QUERY
+    elif backend == "postgresql":
+        params.update(query=query, config=SEARCH_LANGUAGE)
+        sql = POSTGRES_QUERY
+    else:
+        raise NotImplementedError("Full-text search needs SQLite or PostgreSQL")
+    return db.execute(text(sql), params).mappings().all()
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import re
+from uuid import uuid4
+
+from fastapi.responses import StreamingResponse
+
+# Answers are generated by a background task into a per-stream buffer and sent
+# to the client as SSE frames ("id: <stream>:<seq>"). Tokens are coalesced
+# into a frame every SSE_FLUSH_MS or SSE_FLUSH_CHARS, whichever comes first,
+# and an idle connection gets a comment line every SSE_HEARTBEAT_SECONDS so
+# proxies keep it open. If the client drops, generation keeps going for
+# SSE_RESUME_GRACE seconds so it can reconnect with Last-Event-ID; after that
+# the upstream call is cancelled. Finished buffers live for SSE_RESUME_TTL.
+# Buffers are per process: resuming needs the same worker (sticky sessions).
+# The final "done" event carries the stream's stats (token usage, TTFT) as JSON.
+SSE_FLUSH_MS = int(os.getenv("SSE_FLUSH_MS", "50"))
+SSE_FLUSH_CHARS = int(os.getenv("SSE_FLUSH_CHARS", "256"))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", "15"))
+SSE_RESUME_TTL = float(os.getenv("SSE_RESUME_TTL", "120"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "2000"))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # nginx: don't buffer the response
+}
+
+streams = {}
+
+
+def _frame(stream_id: str, seq: int, text: str) -> str:
+    # Multi-line data is one "data:" line per line; clients re-join with "\n".
+    # SSE also ends a line at a bare "\r", so split on every line ending.
+    data = "".join(f"data: {line}\n" for line in re.split(r"\r\n|\r|\n", text))
+    return f"id: {stream_id}:{seq}\n{data}\n"
+
+
+class StreamBuffer:
+    def __init__(self, user: str, stats: dict | None = None):
+        self.id = uuid4().hex
+        self.user = user
+        self.stats = stats
+        self.frames = []  # frame text; seq = position + 1
+        self.done = False
+        self.listeners = 0
+        self.task = None
+        self._changed = asyncio.Event()
+        self._cancel_handle = None
+
+    def _publish(self, text: str):
+        self.frames.append(text)
+        self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _produce(self, source, on_finish):
+        loop = asyncio.get_running_loop()
+        tokens = source.__aiter__()
+        answer, pending = [], []
+        pending_chars, flush_at = 0, None
+        next_token = None
+        completed = False
+        try:
+            while True:
+                if next_token is None:
+                    next_token = asyncio.ensure_future(tokens.__anext__())
+                timeout = max(0.0, flush_at - loop.time()) if pending else None
+                done, _ = await asyncio.wait({next_token}, timeout=timeout)
+                if done:
+                    try:
+                        token = next_token.result()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        next_token = None
+                    answer.append(token)
+                    pending.append(token)
+                    pending_chars += len(token)
+                    if flush_at is None:
+                        flush_at = loop.time() + SSE_FLUSH_MS / 1000
+                if pending and (pending_chars >= SSE_FLUSH_CHARS or loop.time() >= flush_at):
+                    self._publish("".join(pending))
+                    pending, pending_chars, flush_at = [], 0, None
+            if pending:
+                self._publish("".join(pending))
+            completed = True
+        finally:
+            if next_token is not None:
+                next_token.cancel()
+                await asyncio.gather(next_token, return_exceptions=True)
+            # Closing the generator closes the upstream HTTP stream
+            await tokens.aclose()
+            # Persist before "done" so a follow-up sent right away sees this turn
+            try:
+                await on_finish("".join(answer), completed)
+            except Exception as e:
+                print("⚠️ Stream finish failed:", e)
+            self.done = True
+            self._notify()
+            asyncio.get_running_loop().call_later(SSE_RESUME_TTL, streams.pop, self.id, None)
+
+    def cancel(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def _attach(self):
+        self.listeners += 1
+        if self._cancel_handle is not None:
+            self._cancel_handle.cancel()
+            self._cancel_handle = None
+
+    def _detach(self):
+        self.listeners -= 1
+        if self.listeners == 0 and not self.done:
+            self._cancel_handle = asyncio.get_running_loop().call_later(SSE_RESUME_GRACE, self.cancel)
+
+    async def events(self, after: int = 0):
+        """SSE frames after sequence number `after`, then a final "done" event."""
+        self._attach()
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            seq = after
+            while True:
+                changed = self._changed
+                if seq < len(self.frames):
+                    # A slow client gets everything it missed in one write
+                    chunk = "".join(
+                        _frame(self.id, i + 1, self.frames[i]) for i in range(seq, len(self.frames))
+                    )
+                    seq = len(self.frames)
+                    yield chunk
+                    continue
+                if self.done:
+                    data = json.dumps(self.stats) if self.stats else ""
+                    yield f"id: {self.id}:{seq}\nevent: done\ndata: {data}\n\n"
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self._detach()
+
+
+def start_stream(user: str, source, on_finish, stats: dict | None = None) -> StreamBuffer:
+    """Generate `source` (async iterator of text) in the background; on_finish(text, completed) runs at the end.
+
+    `stats` is sent with the final "done" event, so `source` may fill it while it runs.
+    """
+    stream = StreamBuffer(user, stats)
+    streams[stream.id] = stream
+    stream.task = asyncio.create_task(stream._produce(source, on_finish))
+    # Same grace as a dropped client until the first listener attaches
+    stream._cancel_handle = asyncio.get_running_loop().call_later(SSE_RESUME_GRACE, stream.cancel)
+    return stream
+
+
+def get_stream(stream_id: str, user: str):
+    stream = streams.get(stream_id)
+    return stream if stream is not None and stream.user == user else None
+
+
+def last_event_seq(last_event_id: str | None, stream_id: str) -> int:
+    """Sequence number to resume after, from a Last-Event-ID like "<stream>:<seq>"."""
+    if not last_event_id:
+        return 0
+    sid, _, seq = last_event_id.rpartition(":")
+    if sid != stream_id or not seq.isdigit():
+        return 0
+    return int(seq)
+
+
+def sse_response(stream: StreamBuffer, after: int = 0, headers: dict | None = None):
+    return StreamingResponse(
+        stream.events(after),
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "X-Stream-Id": stream.id, **(headers or {})}
+    )
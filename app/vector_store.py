@@ -1,20 +1,600 @@
+import fcntl
+import hashlib
+import json
+from array import array
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import chain
+from uuid import uuid4
+
 import faiss
 import numpy as np
-from openai import OpenAI
 
-client = OpenAI()
+from app.lexical_index import BM25Index
+
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+INDEX_FILE = "index.faiss"
+TEXTS_FILE = "texts.bin"
+OFFSETS_FILE = "offsets.npy"
+META_FILE = "meta.json"
+DOCS_FILE = "docs.json"
+
+# "auto" starts exact (flat) and promotes to RAG_ANN_BACKEND in the background
+# once a store passes RAG_ANN_THRESHOLD vectors.
+INDEX_MODES = ("flat", "hnsw", "ivfpq", "auto")
+RAG_INDEX_MODE = os.getenv("RAG_INDEX_MODE", "auto")
+RAG_ANN_BACKEND = os.getenv("RAG_ANN_BACKEND", "hnsw")
+RAG_ANN_THRESHOLD = int(os.getenv("RAG_ANN_THRESHOLD", "20000"))
+
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+RAG_HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "80"))
+RAG_HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+RAG_PQ_M = int(os.getenv("RAG_PQ_M", "64"))
+# PQ with 8-bit codes needs ~39 training points per centroid
+IVFPQ_MIN_TRAIN = 39 * 256
+
+# Storage precision for flat/HNSW vectors: float32 (exact), float16 or int8
+# scalar quantization. IVF-PQ always stores PQ codes.
+VECTOR_DTYPES = {
+    "float32": None,
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit_uniform,
+}
+RAG_VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32")
+# Margin added around the int8 range learnt from the first batch
+RAG_SQ_RANGE_MARGIN = float(os.getenv("RAG_SQ_RANGE_MARGIN", "0.2"))
+# Chunks of removed documents are tombstoned and filtered out of searches;
+# the store is rebuilt without them once they exceed this share of the index.
+RAG_COMPACT_RATIO = float(os.getenv("RAG_COMPACT_RATIO", "0.25"))
+
+
+class TextArena:
+    """Chunk texts packed into one UTF-8 buffer plus an offsets array.
+
+    In-memory stores grow a bytearray; persisted versions are opened as
+    read-only memory maps of texts.bin / offsets.npy.
+    """
+
+    def __init__(self, data=None, offsets=None):
+        self.data = bytearray() if data is None else data
+        self.offsets = array("q", [0]) if offsets is None else offsets
+
+    @classmethod
+    def open(cls, directory):
+        offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        path = os.path.join(directory, TEXTS_FILE)
+        # np.memmap refuses empty files
+        data = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else b""
+        return cls(data, offsets)
+
+    def extend(self, texts):
+        for text in texts:
+            self.data += text.encode("utf-8")
+            self.offsets.append(len(self.data))
+
+    @property
+    def nbytes(self):
+        return len(self.data) + len(self.offsets) * 8
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return bytes(self.data[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Manifest:
+    """The documents in a store and the chunk ids each one owns.
+
+    Chunks are shared between documents by content hash. Ids no longer owned
+    by any document are tombstoned in `deleted` until the next compaction.
+    """
+
+    def __init__(self, documents=None, deleted=()):
+        # doc id -> {"name", "sha256", "chunks": [[id, hash], ...], "added_at"}
+        self.documents = documents or {}
+        self.deleted = set(deleted)
+        self._selector = None
+
+    @classmethod
+    def open(cls, directory):
+        try:
+            with open(os.path.join(directory, DOCS_FILE)) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls()  # versions written before documents were tracked
+        return cls(data["documents"], data["deleted"])
+
+    def save(self, directory):
+        with open(os.path.join(directory, DOCS_FILE), "w") as f:
+            json.dump({"documents": self.documents, "deleted": sorted(self.deleted)}, f)
+
+    def copy(self):
+        return Manifest(dict(self.documents), self.deleted)
+
+    def chunk_ids(self) -> dict:
+        """Content hash -> id of every chunk owned by a document."""
+        return {h: i for doc in self.documents.values() for i, h in doc["chunks"]}
+
+    def find(self, name: str):
+        return next((doc_id for doc_id, doc in self.documents.items() if doc["name"] == name), None)
+
+    def remove(self, doc_id: str):
+        doc = self.documents.pop(doc_id)
+        owned = {i for d in self.documents.values() for i, _ in d["chunks"]}
+        self.deleted.update(i for i, _ in doc["chunks"] if i not in owned)
+
+    def selector(self):
+        if self.deleted and self._selector is None:
+            ids = np.fromiter(sorted(self.deleted), dtype=np.int64)
+            self._selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(ids))
+        return self._selector
+
+
+def _read_current(path):
+    try:
+        with open(os.path.join(path, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def _file_lock(path):
+    # Serializes writers across uvicorn workers sharing the same store directory
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def has_store(path):
+    return _read_current(path) is not None
+
+
+def build_index(kind, dim, vectors=None, dtype="float32"):
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype: {dtype}")
+    qtype = VECTOR_DTYPES[dtype]
+
+    if kind == "flat":
+        index = faiss.IndexFlatL2(dim) if qtype is None else faiss.IndexScalarQuantizer(dim, qtype)
+    elif kind == "hnsw":
+        if qtype is None:
+            index = faiss.IndexHNSWFlat(dim, RAG_HNSW_M)
+        else:
+            index = faiss.IndexHNSWSQ(dim, qtype, RAG_HNSW_M)
+        index.hnsw.efConstruction = RAG_HNSW_EF_CONSTRUCTION
+    elif kind == "ivfpq":
+        if vectors is None or len(vectors) < IVFPQ_MIN_TRAIN:
+            raise ValueError(f"ivfpq needs at least {IVFPQ_MIN_TRAIN} training vectors")
+        if dim % RAG_PQ_M:
+            raise ValueError(f"dim {dim} is not divisible by RAG_PQ_M={RAG_PQ_M}")
+        nlist = max(1, min(int(4 * np.sqrt(len(vectors))), len(vectors) // 39))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, RAG_PQ_M, 8)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index kind: {kind}")
+
+    if vectors is not None and len(vectors):
+        add_vectors(index, vectors)
+    return index
+
+
+def add_vectors(index, vectors):
+    if not index.is_trained:
+        # int8 SQ learns one global range from the first batch; the margin
+        # keeps later, slightly out-of-range embeddings from clipping.
+        storage = faiss.downcast_index(index.storage) if isinstance(index, faiss.IndexHNSW) else index
+        storage.sq.rangestat = faiss.ScalarQuantizer.RS_minmax
+        storage.sq.rangestat_arg = RAG_SQ_RANGE_MARGIN
+        index.train(vectors)
+    index.add(vectors)
+
+
+def target_kind(mode, ntotal):
+    if mode == "auto":
+        return RAG_ANN_BACKEND if ntotal >= RAG_ANN_THRESHOLD else "flat"
+    if mode == "ivfpq":
+        return "ivfpq" if ntotal >= IVFPQ_MIN_TRAIN else "flat"
+    return mode
+
+
+def search_params(index, sel=None):
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=RAG_HNSW_EF_SEARCH, sel=sel)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=RAG_IVF_NPROBE, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def _needs_compaction(index, manifest):
+    return bool(manifest.deleted) and len(manifest.deleted) >= RAG_COMPACT_RATIO * index.ntotal
+
+
+def _compact(index, texts, meta, manifest):
+    """Rebuild without tombstoned chunks; ids are renumbered, so the generation is bumped."""
+    live = [i for i in range(index.ntotal) if i not in manifest.deleted]
+    if isinstance(index, faiss.IndexIVF):
+        index.make_direct_map()
+    vectors = index.reconstruct_batch(np.array(live, dtype=np.int64)) if live else None
+    kind = target_kind(meta["mode"], len(live))
+    compacted = build_index(kind, index.d, vectors, dtype=meta["dtype"])
+
+    new_ids = {old: new for new, old in enumerate(live)}
+    documents = {
+        doc_id: dict(doc, chunks=[[new_ids[i], h] for i, h in doc["chunks"]])
+        for doc_id, doc in manifest.documents.items()
+    }
+    live_texts = [text for i, text in enumerate(texts) if i in new_ids]
+    meta = dict(meta, kind=kind, generation=meta.get("generation", 0) + 1)
+    return compacted, live_texts, meta, Manifest(documents)
+
+
+def _read_meta(directory):
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    meta.setdefault("mode", "flat")
+    meta.setdefault("kind", "flat")
+    meta.setdefault("dtype", "float32")
+    return meta
+
+
+def _open_version(directory, mmap=True):
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    index = faiss.read_index(os.path.join(directory, INDEX_FILE), flags)
+    return index, TextArena.open(directory), _read_meta(directory), Manifest.open(directory)
+
+
+def _version_nbytes(directory):
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for name in (INDEX_FILE, TEXTS_FILE, OFFSETS_FILE)
+    )
+
+
+def _write_version(path, index, previous, new_texts, meta, manifest):
+    """Write a complete new version directory and atomically point CURRENT at it."""
+    version = f"v-{uuid4().hex}"
+    directory = os.path.join(path, version)
+    os.makedirs(directory)
+
+    faiss.write_index(index, os.path.join(directory, INDEX_FILE))
+
+    texts_path = os.path.join(directory, TEXTS_FILE)
+    offsets = [0]
+    if previous is not None:
+        shutil.copyfile(os.path.join(previous, TEXTS_FILE), texts_path)
+        offsets = np.load(os.path.join(previous, OFFSETS_FILE)).tolist()
+    with open(texts_path, "ab") as f:
+        for text in new_texts:
+            data = text.encode("utf-8")
+            f.write(data)
+            offsets.append(offsets[-1] + len(data))
+    np.save(os.path.join(directory, OFFSETS_FILE), np.array(offsets, dtype=np.int64))
+
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(dict(meta, dim=index.d, ntotal=index.ntotal), f)
+    manifest.save(directory)
+
+    tmp = os.path.join(path, f"{CURRENT_FILE}.{version}")
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(path, CURRENT_FILE))
+    return version
+
+
+def _prune_versions(path, keep):
+    # Keep the previous version around: another worker may have just read CURRENT
+    for name in os.listdir(path):
+        if name.startswith("v-") and name not in keep:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
 
 class VectorStore:
-    def __init__(self, dim=1536):
-        self.index = faiss.IndexFlatL2(dim)
-        self.texts = []
+    def __init__(self, dim=1536, path=None, mode=None, dtype=None):
+        mode = mode or RAG_INDEX_MODE
+        dtype = dtype or RAG_VECTOR_DTYPE
+        if mode not in INDEX_MODES:
+            raise ValueError(f"Unknown index mode: {mode}")
+        self.dim = dim
+        self.path = path
+        self.version = None
+        self.nbytes = 0
+        self._lock = threading.Lock()
+        self._promoting = False
+        self._lexical = BM25Index()
+        self._lexical_generation = 0
+        self._lexical_lock = threading.Lock()
+        # (index, texts, meta, manifest) are swapped together so readers never see a torn view
+        kind = target_kind(mode, 0)
+        self._snapshot = (
+            build_index(kind, dim, dtype=dtype),
+            TextArena(),
+            {"mode": mode, "kind": kind, "dtype": dtype},
+            Manifest(),
+        )
+        if path:
+            self.refresh()
+
+    @property
+    def snapshot(self):
+        """(index, texts, meta, manifest) of one version; ids are only stable within it."""
+        return self._snapshot
+
+    @property
+    def index(self):
+        return self._snapshot[0]
+
+    @property
+    def texts(self):
+        return self._snapshot[1]
+
+    @property
+    def mode(self):
+        return self._snapshot[2]["mode"]
+
+    @property
+    def kind(self):
+        return self._snapshot[2]["kind"]
+
+    @property
+    def dtype(self):
+        return self._snapshot[2]["dtype"]
+
+    @property
+    def manifest(self):
+        return self._snapshot[3]
+
+    @property
+    def generation(self):
+        """Bumped whenever compaction renumbers chunk ids."""
+        return self._snapshot[2].get("generation", 0)
+
+    @property
+    def live_count(self):
+        return self.index.ntotal - len(self.manifest.deleted)
+
+    def refresh(self):
+        """Reopen the latest on-disk version (memory-mapped) if it changed."""
+        if not self.path:
+            return
+        current = _read_current(self.path)
+        if current and current != self.version:
+            self._open(current)
+
+    def _open(self, version):
+        directory = os.path.join(self.path, version)
+        self._snapshot = _open_version(directory)
+        self.version = version
+        self.nbytes = _version_nbytes(directory)
 
     def add(self, embeddings, texts):
-        self.index.add(np.array(embeddings).astype("float32"))
-        self.texts.extend(texts)
+        self.add_batches([(embeddings, texts)])
 
-    def search(self, query_embedding, k=4):
-        D, I = self.index.search(
-            np.array([query_embedding]).astype("float32"), k
+    def add_batches(self, batches):
+        """Append an iterable of (embeddings, texts) and publish them as one version.
+
+        The iterable may be a pipeline that is still producing; the write lock
+        is held until it is exhausted.
+        """
+        def update(index, meta, manifest):
+            new_texts = []
+            for embeddings, texts in batches:
+                add_vectors(index, np.array(embeddings).astype("float32"))
+                new_texts.extend(texts)
+            return new_texts or None
+
+        self._publish(update)
+
+    def add_document(self, name, sha256, hashes, batches, known, generation):
+        """Publish a document, replacing any previous document with the same name.
+
+        `batches` yields (embeddings, texts, hashes) for the chunks that were
+        not in `known` (hash -> id, read at `generation`); every other chunk
+        reuses its id. `hashes` lists all of the document's chunks in order and
+        must be complete once `batches` is exhausted. Returns the document id.
+        """
+        doc_id = uuid4().hex
+
+        def update(index, meta, manifest):
+            base = index.ntotal
+            new_ids, new_texts = {}, []
+            for embeddings, texts, chunk_hashes in batches:
+                add_vectors(index, np.array(embeddings).astype("float32"))
+                for text, h in zip(texts, chunk_hashes):
+                    new_ids[h] = base + len(new_texts)
+                    new_texts.append(text)
+
+            owned = manifest.chunk_ids()
+            chunks = []
+            for h in hashes:
+                i = owned.get(h, new_ids.get(h))
+                if i is None:
+                    # Skipped as known, but its document went away meanwhile:
+                    # the vector is still there unless ids were renumbered
+                    if meta.get("generation", 0) != generation:
+                        raise ValueError("Documents changed during upload, please try again")
+                    i = known[h]
+                chunks.append([i, h])
+            used = {i for i, _ in chunks}
+            # Another upload may have added the same chunk first
+            manifest.deleted.update(i for i in new_ids.values() if i not in used)
+            manifest.deleted.difference_update(used)
+
+            previous = manifest.find(name)
+            manifest.documents[doc_id] = {
+                "name": name,
+                "sha256": sha256,
+                "chunks": chunks,
+                "added_at": datetime.utcnow().isoformat(),
+            }
+            if previous is not None:
+                manifest.remove(previous)
+            return new_texts
+
+        self._publish(update)
+        return doc_id
+
+    def remove_document(self, doc_id) -> bool:
+        def update(index, meta, manifest):
+            manifest.remove(doc_id)
+            return []
+
+        try:
+            self._publish(update)
+        except KeyError:
+            return False
+        return True
+
+    def documents(self):
+        return [
+            {
+                "id": doc_id,
+                "name": doc["name"],
+                "sha256": doc["sha256"],
+                "chunks": len(doc["chunks"]),
+                "added_at": doc["added_at"],
+            }
+            for doc_id, doc in self.manifest.documents.items()
+        ]
+
+    def _publish(self, update):
+        """Apply update(index, meta, manifest) -> appended texts (None: nothing
+        changed) to the latest version and publish the result."""
+        if not self.path:
+            with self._lock:
+                index, stored, meta, manifest = self._snapshot
+                manifest = manifest.copy()
+                new_texts = update(index, meta, manifest)
+                if new_texts is None:
+                    return
+                stored.extend(new_texts)
+                if _needs_compaction(index, manifest):
+                    index, live_texts, meta, manifest = _compact(index, stored, meta, manifest)
+                    stored = TextArena()
+                    stored.extend(live_texts)
+                self._snapshot = (index, stored, meta, manifest)
+                itemsize = {"float32": 4, "float16": 2, "int8": 1}[self.dtype]
+                self.nbytes = itemsize * self.dim * index.ntotal + stored.nbytes
+            return
+
+        with self._lock, _file_lock(self.path):
+            # Copy-on-write: load a private in-memory copy of the latest version,
+            # apply the update, publish a new version and swap to its memory-mapped view.
+            current = _read_current(self.path)
+            previous = os.path.join(self.path, current) if current else None
+            if previous:
+                index, texts, meta, manifest = _open_version(previous, mmap=False)
+            else:
+                # Never the live index: a failing update must leave the served view untouched
+                index = build_index(self.kind, self.dim, dtype=self.dtype)
+                texts, meta, manifest = TextArena(), dict(self._snapshot[2]), Manifest()
+
+            new_texts = update(index, meta, manifest)
+            if new_texts is None:
+                return
+            if _needs_compaction(index, manifest):
+                index, new_texts, meta, manifest = _compact(
+                    index, chain(texts, new_texts), meta, manifest
+                )
+                previous = None
+
+            version = _write_version(self.path, index, previous, new_texts, meta, manifest)
+            self._open(version)
+            _prune_versions(self.path, keep={version, current})
+
+        self._maybe_promote()
+
+    def _maybe_promote(self):
+        if self._promoting or target_kind(self.mode, self.index.ntotal) == self.kind:
+            return
+        self._promoting = True
+        threading.Thread(target=self._promote, daemon=True).start()
+
+    def _promote(self):
+        # Train/build the ANN index off the request path; searches keep using
+        # the current flat version until the new one is published.
+        try:
+            index, _, meta, _ = self._snapshot
+            kind = target_kind(meta["mode"], index.ntotal)
+            n = index.ntotal
+            ann = build_index(kind, self.dim, index.reconstruct_n(0, n), dtype=meta["dtype"])
+
+            with self._lock, _file_lock(self.path):
+                current = _read_current(self.path)
+                directory = os.path.join(self.path, current)
+                latest, _, latest_meta, manifest = _open_version(directory)
+                if latest_meta["kind"] != "flat":
+                    return  # another worker got there first
+                if latest_meta.get("generation", 0) != meta.get("generation", 0):
+                    return  # compacted meanwhile; ids changed
+                if latest.ntotal > n:
+                    ann.add(latest.reconstruct_n(n, latest.ntotal - n))
+
+                version = _write_version(
+                    self.path, ann, directory, [], dict(latest_meta, kind=kind), manifest
+                )
+                self._open(version)
+                _prune_versions(self.path, keep={version, current})
+        except Exception as e:
+            print("Index promotion failed:", e)
+        finally:
+            self._promoting = False
+
+    def search_ids(self, query_embedding, k=4, snapshot=None):
+        return self.search_ids_batch([query_embedding], k, snapshot)[0]
+
+    def search_ids_batch(self, query_embeddings, k=4, snapshot=None):
+        """One index search for a matrix of queries; returns a list of ids per query."""
+        index, _, _, manifest = snapshot or self._snapshot
+        D, I = index.search(
+            np.asarray(query_embeddings, dtype="float32"), k,
+            params=search_params(index, manifest.selector()),
         )
-        return [self.texts[i] for i in I[0]]
+        return [[int(i) for i in row if i >= 0] for row in I]
+
+    def search(self, query_embedding, k=4):
+        snapshot = self._snapshot
+        texts = snapshot[1]
+        return [texts[i] for i in self.search_ids(query_embedding, k, snapshot)]
+
+    @property
+    def resident_bytes(self):
+        """Vectors and texts (nbytes) plus the BM25 index built on demand."""
+        return self.nbytes + self._lexical.nbytes
+
+    def lexical_search(self, query, k=4, snapshot=None):
+        """BM25 over the live chunk texts: [(id, score, matched terms)] best first."""
+        _, texts, meta, manifest = snapshot or self._snapshot
+        generation = meta.get("generation", 0)
+        with self._lexical_lock:
+            # Within a generation versions only append, so catch the index up with new chunks
+            if generation != self._lexical_generation or len(self._lexical) > len(texts):
+                self._lexical = BM25Index()
+                self._lexical_generation = generation
+            if len(self._lexical) < len(texts):
+                self._lexical.add(texts[i] for i in range(len(self._lexical), len(texts)))
+            return self._lexical.search(query, k, exclude=manifest.deleted)
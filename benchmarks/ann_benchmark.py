@@ -0,0 +1,71 @@
+"""Recall vs. latency of the VectorStore index kinds on synthetic embeddings.
+
+    python -m benchmarks.ann_benchmark --n 50000 --queries 200
+
+Ground truth comes from the exact flat index; queries are issued one at a time,
+the same way /generate/stream searches.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.vector_store import build_index, search_params
+
+
+def synthetic_embeddings(n, dim, clusters, seed, latent_dim=64):
+    # Real text embeddings have a much lower intrinsic dimension than 1536, so
+    # sample clustered points in a small latent space and project them up;
+    # isotropic 1536-d noise would be an unrealistically hard case for PQ.
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, latent_dim)).astype("float32")
+    labels = rng.integers(0, clusters, n)
+    latent = centers[labels] + 0.5 * rng.standard_normal((n, latent_dim)).astype("float32")
+    projection = rng.standard_normal((latent_dim, dim)).astype("float32")
+    x = latent @ projection + 0.05 * rng.standard_normal((n, dim)).astype("float32")
+    x /= np.linalg.norm(x, axis=1, keepdims=True)
+    return x
+
+
+def run(kind, base, queries, truth, k):
+    start = time.perf_counter()
+    index = build_index(kind, base.shape[1], base)
+    build_s = time.perf_counter() - start
+
+    params = search_params(index)
+    found = []
+    start = time.perf_counter()
+    for q in queries:
+        _, I = index.search(q[None, :], k, params=params)
+        found.append(I[0])
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+    return build_s, latency_ms, recall
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--kinds", default="flat,hnsw,ivfpq")
+    args = parser.parse_args()
+
+    data = synthetic_embeddings(args.n + args.queries, args.dim, args.clusters, seed=0)
+    base, queries = data[:args.n], data[args.n:]
+
+    exact = build_index("flat", args.dim, base)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"n={args.n} dim={args.dim} queries={args.queries} k={args.k}")
+    print(f"{'kind':<8}{'build s':>10}{'ms/query':>10}{'recall@k':>10}")
+    for kind in args.kinds.split(","):
+        build_s, latency_ms, recall = run(kind, base, queries, truth, args.k)
+        print(f"{kind:<8}{build_s:>10.2f}{latency_ms:>10.3f}{recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Streaming chunker vs. the original encode-everything/decode-every-slice one.
+
+    python -m benchmarks.chunker_benchmark --tokens 500000
+
+Reports wall time and peak traced Python memory for each implementation on
+the same synthetic document.
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.chunker import _token_byte_lengths, chunk_documents, enc, iter_chunks
+
+SENTENCES = [
+    "The service returns HTTP 503 when the upstream model is overloaded.",
+    "Retry with exponential backoff and honour the retry-after header.",
+    "Embeddings are cached by content hash, so re-uploads are cheap.",
+    "Überprüfen Sie die Konfiguration, bevor Sie fortfahren.",
+    "向量索引在磁盘上以内存映射方式打开。",
+]
+
+
+def legacy_chunk_text(text, max_tokens=300, overlap=50):
+    tokens = enc.encode(text)
+    chunks = []
+
+    start = 0
+    while start < len(tokens):
+        end = start + max_tokens
+        chunk = enc.decode(tokens[start:end])
+        chunks.append(chunk)
+        start = end - overlap
+
+    return chunks
+
+
+def synthetic_pages(approx_tokens, seed=0):
+    rng = np.random.default_rng(seed)
+    pages, tokens = [], 0
+    while tokens < approx_tokens:
+        page = "\n\n".join(
+            " ".join(rng.choice(SENTENCES, 6)) for _ in range(8)
+        )
+        pages.append(page)
+        tokens += len(enc.encode_ordinary(page))
+    return pages
+
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=500000)
+    parser.add_argument("--docs", type=int, default=50, help="documents for the batch-encode case")
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.tokens)
+    text = "\n".join(pages)
+    _token_byte_lengths()  # one-off table build, not part of the per-document cost
+
+    cases = [
+        ("legacy chunk_text", lambda: legacy_chunk_text(text)),
+        ("iter_chunks (whole text)", lambda: list(iter_chunks([text]))),
+        ("iter_chunks (streamed pages)", lambda: list(iter_chunks(p + "\n" for p in pages))),
+        ("iter_chunks (sentence snap)", lambda: list(iter_chunks((p + "\n" for p in pages), boundary="sentence"))),
+    ]
+    print(f"~{args.tokens} tokens, {len(pages)} pages")
+    print(f"{'case':<32}{'chunks':>8}{'seconds':>10}{'peak MB':>10}")
+    for name, fn in cases:
+        chunks, elapsed, peak = measure(fn)
+        print(f"{name:<32}{len(chunks):>8}{elapsed:>10.3f}{peak / 2**20:>10.1f}")
+
+    docs = [" ".join(pages[i::args.docs]) for i in range(args.docs)]
+    for name, fn in [
+        ("legacy, one doc at a time", lambda: [legacy_chunk_text(d) for d in docs]),
+        ("chunk_documents (batched)", lambda: chunk_documents(docs)),
+    ]:
+        chunks, elapsed, peak = measure(fn)
+        print(f"{name:<32}{sum(map(len, chunks)):>8}{elapsed:>10.3f}{peak / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
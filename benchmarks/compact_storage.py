@@ -0,0 +1,61 @@
+"""Per-chunk memory and recall loss of the compact VectorStore storage modes.
+
+    python -m benchmarks.compact_storage --n 20000
+
+Recall@k is measured against the float32 flat index (the original store).
+Text cost compares a list of Python str objects with the TextArena.
+"""
+import argparse
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from app.vector_store import TextArena, build_index
+from benchmarks.ann_benchmark import synthetic_embeddings
+
+WORDS = "the model returns an error when the request payload exceeds the configured limit".split()
+
+
+def synthetic_chunks(n, words_per_chunk, seed):
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(WORDS, words_per_chunk)) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--kind", default="flat")
+    args = parser.parse_args()
+
+    data = synthetic_embeddings(args.n + args.queries, args.dim, clusters=100, seed=0)
+    base, queries = data[:args.n], data[args.n:]
+    _, truth = build_index("flat", args.dim, base).search(queries, args.k)
+
+    print(f"n={args.n} dim={args.dim} kind={args.kind} k={args.k}")
+    print(f"{'dtype':<9}{'B/vector':>10}{'ms/query':>10}{'recall@k':>10}")
+    for dtype in ("float32", "float16", "int8"):
+        index = build_index(args.kind, args.dim, base, dtype=dtype)
+        size = len(faiss.serialize_index(index)) / args.n
+
+        start = time.perf_counter()
+        _, found = index.search(queries, args.k)
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        recall = np.mean([len(set(f) & set(t)) / args.k for f, t in zip(found, truth)])
+        print(f"{dtype:<9}{size:>10.0f}{latency_ms:>10.3f}{recall:>10.3f}")
+
+    # ~300 tokens of English per chunk, as produced by chunk_text()
+    texts = synthetic_chunks(args.n, 220, seed=1)
+    as_list = sys.getsizeof(texts) + sum(sys.getsizeof(t) for t in texts)
+    arena = TextArena()
+    arena.extend(texts)
+    print(f"texts: list[str] {as_list / args.n:.0f} B/chunk, arena {arena.nbytes / args.n:.0f} B/chunk")
+
+
+if __name__ == "__main__":
+    main()
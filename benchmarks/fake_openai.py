@@ -0,0 +1,189 @@
+"""Local stand-in for the OpenAI API, for offline benchmarks and load tests.
+
+    uvicorn benchmarks.fake_openai:app --port 9000
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 uvicorn app.main:app
+
+Embeddings are deterministic per input text (unit-norm, seeded by its hash),
+so the same chunk always maps to the same vector. Chat completions answer
+with a deterministic word sequence, streamed at a fixed token rate.
+
+Environment:
+    FAKE_OPENAI_LATENCY_MS        added latency per request (default 50)
+    FAKE_OPENAI_MAX_INPUTS        reject embedding requests with more inputs (default 2048)
+    FAKE_OPENAI_FAIL_RATE         fraction of requests answered with 429 (default 0)
+    FAKE_OPENAI_TTFT_MS           chat: delay before the first token (default 300)
+    FAKE_OPENAI_TOKENS_PER_SECOND chat: streaming rate (default 50)
+    FAKE_OPENAI_ANSWER_TOKENS     chat: tokens per answer (default 100)
+    FAKE_OPENAI_PREFILL_MS_PER_1K chat: extra TTFT per 1000 uncached prompt tokens (default 0)
+
+Chat prompts go through a simulated prefix cache shaped like OpenAI's: a
+prompt whose leading messages were seen before reports them as
+usage.prompt_tokens_details.cached_tokens (1024+ tokens, in 128-token steps)
+and skips their prefill time.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("FAKE_OPENAI_LATENCY_MS", "50"))
+MAX_INPUTS = int(os.getenv("FAKE_OPENAI_MAX_INPUTS", "2048"))
+FAIL_RATE = float(os.getenv("FAKE_OPENAI_FAIL_RATE", "0"))
+TTFT_MS = float(os.getenv("FAKE_OPENAI_TTFT_MS", "300"))
+TOKENS_PER_SECOND = float(os.getenv("FAKE_OPENAI_TOKENS_PER_SECOND", "50"))
+ANSWER_TOKENS = int(os.getenv("FAKE_OPENAI_ANSWER_TOKENS", "100"))
+PREFILL_MS_PER_1K = float(os.getenv("FAKE_OPENAI_PREFILL_MS_PER_1K", "0"))
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+CACHE_MAX_PREFIXES = 100000
+EMBEDDING_DIM = 1536
+
+WORDS = ("the", "model", "answer", "uses", "context", "from", "your", "documents", "and",
+         "history", "to", "explain", "each", "step", "clearly", "with", "an", "example")
+
+app = FastAPI(title="Fake OpenAI")
+_prefixes = OrderedDict()  # hash of a message prefix -> None, LRU
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype("float32")
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def _error(status: int, message: str, headers=None):
+    return JSONResponse(
+        {"error": {"message": message, "type": "fake_error", "code": None}},
+        status_code=status,
+        headers=headers,
+    )
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    await asyncio.sleep(LATENCY_MS / 1000)
+    if FAIL_RATE and random.random() < FAIL_RATE:
+        return _error(429, "Rate limit reached", headers={"retry-after": "0.1"})
+
+    inputs = body["input"]
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    if len(inputs) > MAX_INPUTS:
+        return _error(400, f"Too many inputs: {len(inputs)} > {MAX_INPUTS}")
+
+    return {
+        "object": "list",
+        "model": body.get("model", "text-embedding-3-small"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+            for i, text in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+def fake_answer(messages: list, n_tokens: int = ANSWER_TOKENS) -> list[str]:
+    seed = int.from_bytes(hashlib.sha256(json.dumps(messages).encode("utf-8")).digest()[:8], "little")
+    rng = random.Random(seed)
+    return [rng.choice(WORDS) + " " for _ in range(n_tokens)]
+
+
+def _prompt_tokens(messages: list) -> int:
+    # ~4 characters per token is close enough for load tests
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4
+
+
+def _cached_tokens(messages: list) -> int:
+    # Message granularity: the real cache matches tokens, but only whole
+    # leading messages are stable between turns anyway
+    h = hashlib.sha256()
+    cached, tokens, hit = 0, 0, True
+    for message in messages:
+        h.update(json.dumps(message, sort_keys=True).encode("utf-8"))
+        tokens += _prompt_tokens([message])
+        key = h.hexdigest()
+        if hit and key in _prefixes:
+            cached = tokens
+            _prefixes.move_to_end(key)
+        else:
+            hit = False
+            _prefixes[key] = None
+    while len(_prefixes) > CACHE_MAX_PREFIXES:
+        _prefixes.popitem(last=False)
+    if cached < CACHE_MIN_TOKENS:
+        return 0
+    return cached // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+
+
+def _chunk(body, delta, finish_reason=None, usage=None):
+    chunk = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o-mini"),
+        "choices": [] if delta is None else [
+            {"index": 0, "delta": delta, "finish_reason": finish_reason}
+        ],
+    }
+    if usage is not None:
+        chunk["usage"] = usage
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(LATENCY_MS / 1000)
+    if FAIL_RATE and random.random() < FAIL_RATE:
+        return _error(429, "Rate limit reached", headers={"retry-after": "0.5"})
+
+    tokens = fake_answer(body["messages"])
+    prompt_tokens = _prompt_tokens(body["messages"])
+    cached = _cached_tokens(body["messages"])
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt_tokens + len(tokens),
+        "prompt_tokens_details": {"cached_tokens": cached},
+    }
+    ttft = (TTFT_MS + PREFILL_MS_PER_1K * (prompt_tokens - cached) / 1000) / 1000
+
+    if not body.get("stream"):
+        await asyncio.sleep(ttft + len(tokens) / TOKENS_PER_SECOND)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    async def stream():
+        await asyncio.sleep(ttft)
+        yield _chunk(body, {"role": "assistant", "content": ""})
+        start = time.perf_counter()
+        for i, token in enumerate(tokens):
+            # Pace against the clock so slow event loops don't stretch the rate
+            delay = start + i / TOKENS_PER_SECOND - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield _chunk(body, {"content": token})
+        yield _chunk(body, {}, finish_reason="stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield _chunk(body, None, usage=usage)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
@@ -0,0 +1,336 @@
+"""Load-test scenarios for the whole service, offline.
+
+    python -m benchmarks.loadtest                       # all scenarios, spawned app + fake OpenAI
+    python -m benchmarks.loadtest chat --users 50 --requests 4
+    python -m benchmarks.loadtest upload --files 8 --size-kb 512
+    python -m benchmarks.loadtest pagination --messages 20000
+    python -m benchmarks.loadtest login --burst 100
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 chat   # against a running app
+
+By default this starts benchmarks/fake_openai.py and the app (uvicorn, one
+worker, a fresh SQLite database) and points the app at the fake server.
+Extra environment variables (FAKE_OPENAI_*, LLM_*, RAG_*, ...) are passed
+through to both. Each scenario prints p50/p99 latency and throughput; for a
+spawned app it also prints the server's current and peak RSS, so runs can be
+compared to catch regressions. The pagination scenario seeds messages
+directly into the database and needs --database-url with --url.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import httpx
+import numpy as np
+
+SCENARIOS = ("chat", "upload", "pagination", "login")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "loadtest-password"
+
+
+# --- reporting ---
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else float("nan")
+
+
+def report(name, latencies, wall, extra=None, server=None):
+    line = (
+        f"{name:<22} n={len(latencies):<6} p50={percentile(latencies, 50):8.1f}ms "
+        f"p99={percentile(latencies, 99):8.1f}ms  {len(latencies) / wall:8.1f}/s"
+    )
+    if extra:
+        line += "  " + "  ".join(f"{k}={v}" for k, v in extra.items())
+    if server is not None and server.pid:
+        rss, peak = server.memory()
+        line += f"  rss={rss / 1024:.0f}MB peak={peak / 1024:.0f}MB"
+    print(line, flush=True)
+
+
+# --- spawned servers ---
+class Server:
+    def __init__(self, module, port, env):
+        self.port = port
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", module, "--port", str(port), "--log-level", "warning"],
+            env=env,
+            cwd=ROOT,
+        )
+        self.pid = self.process.pid
+
+    def wait_ready(self, path, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"server on port {self.port} exited with {self.process.returncode}")
+            try:
+                httpx.get(f"http://127.0.0.1:{self.port}{path}", timeout=1)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise RuntimeError(f"server on port {self.port} did not start")
+
+    def memory(self):
+        """(current, peak) resident memory in KiB, from /proc."""
+        values = {}
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    key, _, rest = line.partition(":")
+                    if key in ("VmRSS", "VmHWM"):
+                        values[key] = int(rest.split()[0])
+        except OSError:
+            pass
+        return values.get("VmRSS", 0), values.get("VmHWM", 0)
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def spawn(args):
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "loadtest")
+    env.setdefault("SECRET_KEY", "loadtest")
+    env.update(
+        OPENAI_BASE_URL=f"http://127.0.0.1:{args.fake_port}/v1",
+        DATABASE_URL=f"sqlite:///{workdir}/app.db",
+        RAG_STORE_DIR=f"{workdir}/rag_stores",
+        INGEST_UPLOAD_DIR=f"{workdir}/uploads",
+    )
+    env.pop("EMBEDDINGS_BASE_URL", None)
+    fake = Server("benchmarks.fake_openai:app", args.fake_port, env)
+    fake.wait_ready("/docs")
+    app = Server("app.main:app", args.port, env)
+    app.wait_ready("/")
+    args.url = f"http://127.0.0.1:{args.port}"
+    args.database_url = env["DATABASE_URL"]
+    print(f"spawned fake OpenAI on :{args.fake_port} and app on :{args.port} ({workdir})")
+    return fake, app
+
+
+# --- helpers ---
+async def new_user(client, prefix):
+    username = f"{prefix}-{uuid4().hex[:8]}"
+    await client.post("/auth/signup", json={"username": username, "password": PASSWORD})
+    r = await client.post("/auth/login", json={"username": username, "password": PASSWORD})
+    r.raise_for_status()
+    return username, {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+async def new_conversation(client, headers, title="load test"):
+    r = await client.post("/conversations", headers=headers, json={"title": title})
+    r.raise_for_status()
+    return r.json()["id"]
+
+
+# --- scenarios ---
+async def chat(client, args, server):
+    """Concurrent users, each sending --requests prompts to /generate/stream in turn."""
+    ttft, totals, statuses = [], [], {}
+    chars, prompt_tokens, cached_tokens = 0, 0, 0
+
+    async def user(i):
+        nonlocal chars, prompt_tokens, cached_tokens
+        _, headers = await new_user(client, "chat")
+        conversation_id = await new_conversation(client, headers)
+        for n in range(args.requests):
+            start = time.perf_counter()
+            first = None
+            payload = {"conversation_id": conversation_id, "prompt": f"user {i} question {n}: explain step {n}"}
+            async with client.stream("POST", "/generate/stream", headers=headers, json=payload) as r:
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+                event = None
+                async for line in r.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[7:]
+                    elif not line:
+                        event = None
+                    elif event == "done" and line.startswith("data: {"):
+                        # Token usage of this request
+                        usage = json.loads(line[6:])
+                        prompt_tokens += usage.get("prompt_tokens", 0)
+                        cached_tokens += usage.get("cached_tokens", 0)
+                    elif line.startswith("data: ") and len(line) > 6:
+                        first = first or time.perf_counter()
+                        chars += len(line) - 6
+            if r.status_code == 200:
+                totals.append(time.perf_counter() - start)
+                if first:
+                    ttft.append(first - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[user(i) for i in range(args.users)])
+    wall = time.perf_counter() - start
+    cached = f"{100 * cached_tokens / prompt_tokens:.0f}%" if prompt_tokens else "n/a"
+    report("chat first token", ttft, wall, {"prompt_tokens": prompt_tokens, "cached": cached}, server)
+    report("chat full answer", totals, wall, {"chars/s": f"{chars / wall:.0f}", "status": statuses}, server)
+
+
+def synthetic_document(size_kb, seed):
+    rng = np.random.default_rng(seed)
+    words = "the service stores every uploaded document as chunks with embeddings for retrieval".split()
+    paragraphs, size = [], 0
+    while size < size_kb * 1024:
+        paragraph = " ".join(rng.choice(words, 80)) + "."
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs).encode("utf-8")
+
+
+async def upload(client, args, server):
+    """--files concurrent uploads of --size-kb text documents, polled until indexed."""
+    _, headers = await new_user(client, "upload")
+    conversation_id = await new_conversation(client, headers)
+    latencies, chunks, failed = [], 0, 0
+
+    async def one(i):
+        nonlocal chunks, failed
+        start = time.perf_counter()
+        files = {"file": (f"doc-{i}.txt", synthetic_document(args.size_kb, i), "text/plain")}
+        r = await client.post(f"/upload?conversation_id={conversation_id}", headers=headers, files=files)
+        r.raise_for_status()
+        job_id = r.json()["job_id"]
+        while True:
+            job = (await client.get(f"/upload/jobs/{job_id}", headers=headers)).json()
+            if job["status"] in ("done", "failed"):
+                break
+            await asyncio.sleep(0.1)
+        if job["status"] == "done":
+            latencies.append(time.perf_counter() - start)
+            chunks += job["chunks_stored"]
+        else:
+            failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(args.files)])
+    wall = time.perf_counter() - start
+    report("upload to indexed", latencies, wall,
+           {"chunks/s": f"{chunks / wall:.0f}", "failed": failed}, server)
+
+
+def seed_messages(database_url, conversation_id, n):
+    from sqlalchemy import create_engine, insert
+
+    from app.db.conversation import Message
+
+    engine = create_engine(database_url)
+    start = datetime.utcnow() - timedelta(days=1)
+    with engine.begin() as conn:
+        for offset in range(0, n, 5000):
+            conn.execute(insert(Message), [
+                {"id": str(uuid4()), "conversation_id": conversation_id,
+                 "role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}",
+                 "created_at": start + timedelta(milliseconds=i)}
+                for i in range(offset, min(offset + 5000, n))
+            ])
+    engine.dispose()
+
+
+async def pagination(client, args, server):
+    """Walk a --messages long conversation page by page, by cursor and by offset."""
+    if not args.database_url:
+        print("pagination: needs --database-url (or a spawned app); skipped")
+        return
+    _, headers = await new_user(client, "pages")
+    conversation_id = await new_conversation(client, headers)
+    os.environ.setdefault("DATABASE_URL", args.database_url)
+    await asyncio.to_thread(seed_messages, args.database_url, conversation_id, args.messages)
+    url = f"/conversations/{conversation_id}/messages"
+
+    for strategy in ("cursor", "offset"):
+        latencies, seen, cursor = [], 0, None
+        start = time.perf_counter()
+        while True:
+            params = {"limit": args.page}
+            if strategy == "cursor" and cursor:
+                params["cursor"] = cursor
+            elif strategy == "offset":
+                params["offset"] = seen
+            t = time.perf_counter()
+            body = (await client.get(url, headers=headers, params=params)).json()
+            latencies.append(time.perf_counter() - t)
+            seen += len(body["messages"])
+            cursor = body.get("next_cursor")
+            if len(body["messages"]) < args.page or (strategy == "cursor" and not cursor):
+                break
+        wall = time.perf_counter() - start
+        deepest = percentile(latencies[-max(1, len(latencies) // 10):], 50)
+        report(f"pages by {strategy}", latencies, wall,
+               {"messages": seen, "last10%_p50": f"{deepest:.1f}ms"}, server)
+
+
+async def login(client, args, server):
+    """--burst simultaneous logins for one user (argon2 verify under contention)."""
+    username = f"login-{uuid4().hex[:8]}"
+    await client.post("/auth/signup", json={"username": username, "password": PASSWORD})
+    latencies, statuses = [], {}
+
+    async def one():
+        start = time.perf_counter()
+        r = await client.post("/auth/login", json={"username": username, "password": PASSWORD})
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+        if r.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+
+    # A cheap request racing the burst shows whether logins starve other traffic
+    async def probe():
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        await client.get("/")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = await asyncio.gather(probe(), *[one() for _ in range(args.burst)])
+    wall = time.perf_counter() - start
+    report("login burst", latencies, wall,
+           {"status": statuses, "probe": f"{results[0] * 1000:.1f}ms"}, server)
+
+
+async def run(args, server):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        for name in args.scenarios:
+            await globals()[name](client, args, server)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--url", help="test a running app instead of spawning one")
+    parser.add_argument("--database-url", help="the running app's database, for seeding")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fake-port", type=int, default=9765)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=3)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--size-kb", type=int, default=256)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--page", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=50)
+    args = parser.parse_args()
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    spawned = spawn(args) if not args.url else ()
+    try:
+        asyncio.run(run(args, spawned[1] if spawned else None))
+    finally:
+        for server in spawned:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""OFFSET/LIMIT vs keyset pagination of conversations and messages.
+
+    python -m benchmarks.pagination_benchmark --conversations 100000 --messages 200000
+    python -m benchmarks.pagination_benchmark --url postgresql://... --keep
+
+Seeds one user's conversations and one long conversation, then times
+fetching a page at increasing depths with both strategies (same queries
+as app/routers/conversations.py).
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+# The app modules read DATABASE_URL at import time, hence the late imports
+from sqlalchemy import create_engine, desc, insert, tuple_  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.db.conversation import Conversation, Message  # noqa: E402
+from app.db.database import Base  # noqa: E402
+
+USER = "bench-user"
+
+
+def seed(engine, n_conversations, n_messages, batch=10000):
+    start = datetime(2024, 1, 1)
+    conversation_id = None
+    with engine.begin() as conn:
+        for offset in range(0, n_conversations, batch):
+            rows = []
+            for i in range(offset, min(offset + batch, n_conversations)):
+                ts = start + timedelta(seconds=i)
+                rows.append({"id": str(uuid4()), "user_id": USER, "title": f"chat {i}",
+                             "created_at": ts, "updated_at": ts})
+            conn.execute(insert(Conversation), rows)
+            conversation_id = conversation_id or rows[0]["id"]
+        for offset in range(0, n_messages, batch):
+            conn.execute(insert(Message), [
+                {"id": str(uuid4()), "conversation_id": conversation_id,
+                 "role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}",
+                 "created_at": start + timedelta(milliseconds=i)}
+                for i in range(offset, min(offset + batch, n_messages))
+            ])
+    return conversation_id
+
+
+def conversations_offset(db, depth, limit):
+    return (
+        db.query(Conversation).filter(Conversation.user_id == USER)
+        .order_by(desc(Conversation.updated_at), desc(Conversation.id))
+        .offset(depth).limit(limit).all()
+    )
+
+
+def conversations_keyset(db, last, limit):
+    q = db.query(Conversation).filter(Conversation.user_id == USER)
+    if last is not None:
+        q = q.filter(tuple_(Conversation.updated_at, Conversation.id) < (last.updated_at, last.id))
+    return q.order_by(desc(Conversation.updated_at), desc(Conversation.id)).limit(limit).all()
+
+
+def messages_offset(db, conversation_id, depth, limit):
+    return (
+        db.query(Message).filter(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.asc(), Message.id.asc())
+        .offset(depth).limit(limit).all()
+    )
+
+
+def messages_keyset(db, conversation_id, last, limit):
+    q = db.query(Message).filter(Message.conversation_id == conversation_id)
+    if last is not None:
+        q = q.filter(tuple_(Message.created_at, Message.id) > (last.created_at, last.id))
+    return q.order_by(Message.created_at.asc(), Message.id.asc()).limit(limit).all()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="database URL (default: temporary SQLite file)")
+    parser.add_argument("--conversations", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="don't drop the seeded tables")
+    args = parser.parse_args()
+
+    url = args.url or f"sqlite:///{tempfile.mkdtemp()}/pagination.db"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    started = time.perf_counter()
+    conversation_id = seed(engine, args.conversations, args.messages)
+    print(f"seeded {args.conversations} conversations, {args.messages} messages "
+          f"in {time.perf_counter() - started:.1f}s ({url})")
+
+    with Session(engine) as db:
+        for name, total, offset_page, keyset_page in (
+            ("conversations", args.conversations,
+             lambda depth: conversations_offset(db, depth, args.limit),
+             lambda last: conversations_keyset(db, last, args.limit)),
+            ("messages", args.messages,
+             lambda depth: messages_offset(db, conversation_id, depth, args.limit),
+             lambda last: messages_keyset(db, conversation_id, last, args.limit)),
+        ):
+            print(f"\n{name} (page of {args.limit})")
+            print(f"{'depth':>10}{'offset ms':>12}{'keyset ms':>12}")
+            for fraction in (0, 0.1, 0.5, 0.9, 0.99):
+                depth = int(total * fraction)
+                # The keyset cursor is the last row of the previous page
+                last = offset_page(depth - 1)[0] if depth else None
+                offset_ms, by_offset = timed(lambda: offset_page(depth), args.repeat)
+                keyset_ms, by_keyset = timed(lambda: keyset_page(last), args.repeat)
+                assert [r.id for r in by_offset] == [r.id for r in by_keyset]
+                print(f"{depth:>10}{offset_ms:>12.2f}{keyset_ms:>12.2f}")
+
+    if not args.keep:
+        Base.metadata.drop_all(bind=engine)
+
+
+if __name__ == "__main__":
+    main()
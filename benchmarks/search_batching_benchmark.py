@@ -0,0 +1,95 @@
+"""Throughput of micro-batched vs. per-request vector search under concurrency.
+
+    python -m benchmarks.search_batching_benchmark --n 20000 --concurrency 64
+
+Simulates --concurrency requests searching the same store at once, each
+issuing --requests searches back to back, first through the per-request path
+(one index.search per query in the thread pool) and then through
+SearchBatcher with each --window-ms / --max-batch setting.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+# app.retrieval imports app.embeddings, which builds its OpenAI clients at
+# import time; the benchmark never calls the API, so any key will do
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import numpy as np  # noqa: E402
+from fastapi.concurrency import run_in_threadpool  # noqa: E402
+
+from app.retrieval import SearchBatcher  # noqa: E402
+from app.vector_store import VectorStore  # noqa: E402
+from benchmarks.ann_benchmark import synthetic_embeddings  # noqa: E402
+
+
+async def drive(search, queries, concurrency, requests):
+    latencies = []
+
+    async def client(c):
+        for r in range(requests):
+            query = queries[(c * requests + r) % len(queries)]
+            start = time.perf_counter()
+            await search(query)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(c) for c in range(concurrency)])
+    return time.perf_counter() - start, latencies
+
+
+def report(name, wall, latencies, extra=""):
+    ms = np.array(latencies) * 1000
+    print(
+        f"{name:<28} {len(latencies) / wall:9.0f} q/s  p50={np.percentile(ms, 50):7.2f}ms "
+        f"p99={np.percentile(ms, 99):7.2f}ms  {extra}"
+    )
+
+
+async def run(store, queries, args):
+    snapshot = store.snapshot
+
+    async def single(query):
+        return await run_in_threadpool(store.search_ids, query, args.k, snapshot)
+
+    wall, latencies = await drive(single, queries, args.concurrency, args.requests)
+    report("per-request", wall, latencies)
+
+    for window in [float(w) for w in args.window_ms.split(",")]:
+        for max_batch in [int(b) for b in args.max_batch.split(",")]:
+            batcher = SearchBatcher(window, max_batch)
+
+            async def batched(query):
+                return await batcher.search(store, query, args.k, snapshot)
+
+            wall, latencies = await drive(batched, queries, args.concurrency, args.requests)
+            stats = batcher.stats()
+            report(
+                f"batched window={window:g}ms max={max_batch}", wall, latencies,
+                f"avg_batch={stats['avg_batch']:.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--mode", default="flat", help="VectorStore index mode")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--window-ms", default="0,2,5")
+    parser.add_argument("--max-batch", default="32")
+    args = parser.parse_args()
+
+    data = synthetic_embeddings(args.n + 1000, args.dim, clusters=100, seed=0)
+    store = VectorStore(dim=args.dim, mode=args.mode)
+    store.add(data[:args.n], [f"chunk {i}" for i in range(args.n)])
+    print(f"{args.mode} store, {store.index.ntotal} vectors, dim {args.dim}, k={args.k}, "
+          f"{args.concurrency} concurrent x {args.requests} searches")
+    asyncio.run(run(store, data[args.n:], args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import pytest
+
+from app.chunker import enc, iter_chunks, chunk_text
+
+
+def _words(n):
+    return "".join(f" word{i}" for i in range(n))
+
+
+def _tokens(n):
+    # " the" repeated encodes to exactly one token per repetition
+    return " the" * n
+
+
+def _old_chunk_text(text, max_tokens=300, overlap=50):
+    # The list-slicing chunker iter_chunks replaced
+    tokens = enc.encode(text)
+    chunks = []
+    start = 0
+    while start < len(tokens):
+        end = start + max_tokens
+        chunks.append(enc.decode(tokens[start:end]))
+        start = end - overlap
+    return chunks
+
+
+@pytest.mark.parametrize("n_tokens", [1, 40, 301, 551, 1234])
+def test_matches_the_old_chunker_when_it_had_no_redundant_tail(n_tokens):
+    text = _tokens(n_tokens)
+    assert chunk_text(text, max_tokens=300, overlap=50) == _old_chunk_text(text)
+
+
+@pytest.mark.parametrize("n_tokens", [299, 300, 549, 550, 800])
+def test_drops_the_tail_the_previous_chunk_already_covers(n_tokens):
+    # The old chunker ended these with a chunk holding only tokens that the
+    # previous chunk already ended with
+    text = _tokens(n_tokens)
+    old = _old_chunk_text(text)
+    assert old[-2].endswith(old[-1])
+    assert chunk_text(text) == old[:-1]
+
+
+def test_consecutive_chunks_overlap():
+    chunks = chunk_text(_words(500), max_tokens=100, overlap=20)
+    tokens = [enc.encode(chunk) for chunk in chunks]
+    assert all(len(t) == 100 for t in tokens[:-1])
+    for previous, current in zip(tokens, tokens[1:]):
+        assert previous[-20:] == current[:20]
+
+
+def test_streamed_pieces_chunk_like_one_text():
+    words = [f" word{i}" for i in range(700)]
+    streamed = list(iter_chunks(iter(words), max_tokens=120, overlap=30, batch_size=7))
+    assert streamed == chunk_text("".join(words), max_tokens=120, overlap=30)
+
+
+def test_sentence_boundary_cuts_at_sentence_ends():
+    text = "".join(f"Sentence number {i} has a few words in it. " for i in range(200))
+    chunks = list(iter_chunks([text], max_tokens=100, overlap=10, boundary="sentence"))
+    for chunk in chunks[:-1]:
+        assert chunk.endswith(". ")
+        assert 50 <= len(enc.encode(chunk)) <= 100
+    assert text.endswith(chunks[-1])
+
+
+def test_rejects_overlap_not_smaller_than_max_tokens():
+    with pytest.raises(ValueError):
+        iter_chunks(["text"], max_tokens=10, overlap=10)
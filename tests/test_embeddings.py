@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from app import embeddings
+from app.embedding_cache import EmbeddingCache
+
+
+def test_single_batch_runs_on_the_bounded_pool(monkeypatch):
+    threads = []
+
+    def fake_create(inputs):
+        threads.append(threading.current_thread().name)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=[float(i)]) for i in range(len(inputs))
+        ])
+
+    monkeypatch.setattr(embeddings, "_create", fake_create)
+    result = embeddings.embed_texts(["single batch one", "single batch two"])
+
+    assert [e.tolist() for e in result] == [[0.0], [1.0]]
+    assert len(threads) == 1 and threads[0].startswith("embed")
+
+
+def test_query_cache_disk_tier_runs_off_the_event_loop(monkeypatch, tmp_path):
+    cache = EmbeddingCache(10, str(tmp_path / "embeddings.db"))
+    threads = []
+    get_many, put_many = cache.get_many, cache.put_many
+
+    def record(fn):
+        def wrapper(*args):
+            threads.append(threading.current_thread())
+            return fn(*args)
+        return wrapper
+
+    monkeypatch.setattr(cache, "get_many", record(get_many))
+    monkeypatch.setattr(cache, "put_many", record(put_many))
+    monkeypatch.setattr(embeddings, "embedding_cache", cache)
+
+    async def fake_acreate(query):
+        return SimpleNamespace(data=[SimpleNamespace(index=0, embedding=[1.0, 2.0])])
+
+    monkeypatch.setattr(embeddings, "_acreate", fake_acreate)
+    assert asyncio.run(embeddings.aembed_query("hello")).tolist() == [1.0, 2.0]
+    assert len(threads) == 2 and threading.main_thread() not in threads
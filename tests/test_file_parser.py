@@ -0,0 +1,12 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app import file_parser
+
+
+def test_parse_pool_recovers_after_a_worker_dies():
+    with pytest.raises(BrokenProcessPool):
+        file_parser._call(os._exit, 1)
+    assert file_parser._call(len, "abc") == 3
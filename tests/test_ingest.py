@@ -0,0 +1,67 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from app import ingest
+from app.db.database import Base, SessionLocal, engine
+from app.db.ingest_job import IngestJob
+
+
+def test_fail_stale_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_UPLOAD_DIR", str(tmp_path))
+    Base.metadata.create_all(bind=engine)
+    old = datetime.utcnow() - timedelta(seconds=ingest.INGEST_STALE_SECONDS + 60)
+    with SessionLocal() as db:
+        db.add_all([
+            IngestJob(id="stale", user_id="u", conversation_id="c", filename="a.txt",
+                      status="running", updated_at=old),
+            IngestJob(id="live", user_id="u", conversation_id="c", filename="b.txt",
+                      status="queued"),
+        ])
+        db.commit()
+    for job_id in ("stale", "live", "orphan"):
+        path = ingest.upload_path(job_id)
+        open(path, "w").close()
+        past = time.time() - ingest.INGEST_STALE_SECONDS - 60
+        os.utime(path, (past, past))
+
+    assert ingest.fail_stale_jobs() == 1
+
+    with SessionLocal() as db:
+        stale, live = db.get(IngestJob, "stale"), db.get(IngestJob, "live")
+        assert stale.status == "failed" and stale.error
+        assert live.status == "queued"
+    assert sorted(os.listdir(tmp_path)) == ["ingest-live"]
+
+
+def test_jobs_held_by_this_process_are_not_stale(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(ingest, "_active", {"waiting"})
+    Base.metadata.create_all(bind=engine)
+    old = datetime.utcnow() - timedelta(seconds=ingest.INGEST_STALE_SECONDS + 60)
+    with SessionLocal() as db:
+        db.add(IngestJob(id="waiting", user_id="u", conversation_id="c", filename="a.txt",
+                         status="queued", updated_at=old))
+        db.commit()
+
+    assert ingest.fail_stale_jobs() == 0
+    with SessionLocal() as db:
+        job = db.get(IngestJob, "waiting")
+        assert job.status == "queued" and not ingest.is_stale(job)
+
+
+def test_run_job_skips_jobs_no_longer_queued(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "INGEST_UPLOAD_DIR", str(tmp_path))
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        db.add(IngestJob(id="expired", user_id="u", conversation_id="c", filename="a.txt",
+                         status="failed", error="Processing was interrupted"))
+        db.commit()
+    open(ingest.upload_path("expired"), "w").close()
+
+    ingest.run_job("expired")
+
+    with SessionLocal() as db:
+        job = db.get(IngestJob, "expired")
+        assert job.status == "failed" and job.error == "Processing was interrupted"
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import memory
+from app.db.conversation import ConversationSummary, Message
+from app.db.database import Base
+
+START = datetime(2024, 1, 1)
+
+
+def _database(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'memory.db'}")
+    return engine, async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+async def _add_messages(engine, sessions, contents, conversation_id="c"):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessions() as db:
+        db.add_all([
+            Message(conversation_id=conversation_id, role="user" if i % 2 == 0 else "assistant",
+                    content=content, created_at=START + timedelta(seconds=i))
+            for i, content in enumerate(contents)
+        ])
+        await db.commit()
+
+
+def test_turn_writer_close_keeps_batch_in_flight(monkeypatch):
+    written = []
+    flushing = asyncio.Event()
+
+    async def slow_write(turns):
+        flushing.set()
+        await asyncio.sleep(0.05)
+        written.extend(turns)
+
+    monkeypatch.setattr(memory, "_write_turns", slow_write)
+
+    async def run():
+        writer = memory.TurnWriter(interval_ms=1, max_turns=2)
+        for i in range(6):
+            writer.put(("c", f"q{i}", f"a{i}"))
+        await flushing.wait()
+        await writer.close()
+
+    asyncio.run(run())
+    assert [turn[1] for turn in written] == [f"q{i}" for i in range(6)]
+
+
+def test_fold_covers_everything_older_than_the_prompt_window(monkeypatch, tmp_path):
+    engine, sessions = _database(tmp_path)
+    folded = []
+
+    async def summarize(messages):
+        folded.append(messages[-1]["content"])
+        return "summary"
+
+    monkeypatch.setattr(memory, "AsyncSessionLocal", sessions)
+    monkeypatch.setattr(memory, "agenerate_answer", summarize)
+    monkeypatch.setattr(memory, "HISTORY_MAX_MESSAGES", 10)
+    monkeypatch.setattr(memory, "HISTORY_FOLD_TOKENS", 1)
+
+    async def run():
+        await _add_messages(engine, sessions, [f"m{i}" for i in range(30)])
+
+        async with sessions() as db:
+            _, before = await memory.get_history_window(db, "c", budget=10000)
+        await memory.fold_history("c", budget=10000)
+        async with sessions() as db:
+            summary = await db.get(ConversationSummary, "c")
+            _, after = await memory.get_history_window(db, "c", budget=10000)
+        await engine.dispose()
+        return before, summary, after
+
+    before, summary, after = asyncio.run(run())
+    assert [m["content"] for m in before] == [f"m{i}" for i in range(20, 30)]
+    assert summary.summarized_until == START + timedelta(seconds=19)
+    assert "m0" in folded[0] and "m19" in folded[0] and "m20" not in folded[0]
+    assert after == before
+
+
+def test_has_messages_counts_folded_and_unfolded_rows(tmp_path):
+    engine, sessions = _database(tmp_path)
+
+    async def run():
+        await _add_messages(engine, sessions, ["word " * 500, "word " * 500])
+        async with sessions() as db:
+            found = await memory.has_messages(db, "c"), await memory.has_messages(db, "other")
+        await engine.dispose()
+        return found
+
+    assert asyncio.run(run()) == (True, False)
+
+
+def test_window_keeps_the_last_message_when_the_exchange_is_over_budget(tmp_path):
+    engine, sessions = _database(tmp_path)
+
+    async def run():
+        await _add_messages(engine, sessions, ["question " * 300, "answer " * 300])
+        async with sessions() as db:
+            _, window = await memory.get_history_window(db, "c", budget=100)
+        await engine.dispose()
+        return window
+
+    window = asyncio.run(run())
+    assert [m["role"] for m in window] == ["assistant"]
+    assert window[0]["content"].startswith("answer")
+    assert memory.count_tokens(window[0]["content"]) <= 100 + memory.MESSAGE_TOKEN_OVERHEAD
@@ -0,0 +1,7 @@
+from app.metrics import Counter
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_total", "help", labels=("path",))
+    counter.inc(1, 'a\\b"c\nd')
+    assert list(counter.render())[-1] == 'test_total{path="a\\\\b\\"c\\nd"} 1'
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.conversation import Conversation, Message
+from app.db.database import Base
+from app.pagination import decode_cursor, encode_cursor
+from app.routers.conversations import get_conversation_messages, list_conversations
+
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pagination.db'}")
+    Base.metadata.create_all(bind=engine)
+    with sessionmaker(bind=engine)() as session:
+        yield session
+    engine.dispose()
+
+
+def test_cursor_round_trip():
+    when = datetime(2024, 5, 6, 7, 8, 9, 123456)
+    assert decode_cursor(encode_cursor(when, "id-1")) == (when, "id-1")
+    assert decode_cursor(encode_cursor(-1.25, "id-2"), float) == (-1.25, "id-2")
+
+
+def test_invalid_cursor_is_a_400():
+    with pytest.raises(HTTPException) as error:
+        decode_cursor("not a cursor")
+    assert error.value.status_code == 400
+
+
+def test_conversation_pages_cover_ties_once(db):
+    # Three conversations share each updated_at, so only the id breaks ties
+    db.add_all([
+        Conversation(id=f"c{i}", user_id="u", title=f"t{i}", updated_at=START + timedelta(seconds=i // 3))
+        for i in range(8)
+    ])
+    db.add(Conversation(id="other", user_id="someone else", updated_at=START))
+    db.commit()
+
+    seen, cursor = [], None
+    while True:
+        response = Response()
+        page = list_conversations(response, None, 2, 0, cursor, db, "u")
+        seen += [c.id for c in page]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    expected = sorted((f"c{i}" for i in range(8)), key=lambda c: (int(c[1:]) // 3, c), reverse=True)
+    assert seen == expected
+
+
+def test_message_pages_cover_ties_once(db):
+    db.add(Conversation(id="c", user_id="u"))
+    db.add_all([
+        Message(id=f"m{i}", conversation_id="c", role="user", content=f"message {i}",
+                created_at=START + timedelta(seconds=i // 2))
+        for i in range(7)
+    ])
+    db.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = get_conversation_messages("c", 3, 0, cursor, db, "u")
+        seen += [m.id for m in page["messages"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [f"m{i}" for i in range(7)]
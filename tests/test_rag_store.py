@@ -0,0 +1,25 @@
+import numpy as np
+
+from app import rag_store
+
+
+def test_bm25_index_counts_toward_resident_bytes(monkeypatch, tmp_path):
+    monkeypatch.setattr(rag_store, "RAG_STORE_DIR", str(tmp_path))
+    manager = rag_store.StoreManager(max_entries=10, max_bytes=1 << 40)
+    rng = np.random.default_rng(0)
+    texts = [f"chunk {i} about topic{i} and word{i * 7}" for i in range(200)]
+    for name in ("a", "b"):
+        store = manager.get("u", name, create=True, mode="flat")
+        store.add(rng.random((len(texts), store.dim), dtype=np.float32), texts)
+    a = manager.get("u", "a")
+    b = manager.get("u", "b")
+    manager.max_bytes = a.nbytes + b.nbytes + 1024
+
+    a.lexical_search("topic7", k=3)
+    assert a.resident_bytes > a.nbytes + 1024
+    assert manager.stats()["resident_bytes"] == a.resident_bytes + b.resident_bytes
+
+    # The next access notices the grown index and evicts the least recent store
+    manager.get("u", "a")
+    assert manager.stats()["stores"] == 1
+    assert manager.stats()["evictions"] == 1
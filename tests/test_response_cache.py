@@ -0,0 +1,61 @@
+import time
+
+from app.response_cache import ResponseCache
+
+
+def test_similar_lookup_skips_expired_entries(monkeypatch):
+    cache = ResponseCache(max_entries=10, ttl=10, similarity=0.9)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.put("sys", "", "old question", "old answer", embedding=[1.0, 0.0])
+    monkeypatch.setattr(time, "monotonic", lambda: now + 5)
+    cache.put("sys", "", "new question", "new answer", embedding=[0.0, 1.0])
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + 12)
+    assert cache.get_similar("sys", "", [1.0, 0.0]) is None
+    assert cache.get_similar("sys", "", [0.0, 1.0]) == "new answer"
+
+
+def test_exact_hit_ignores_whitespace_differences():
+    cache = ResponseCache(max_entries=10, ttl=60, similarity=0.9)
+    cache.put("sys", "ctx", "What is  RAG?", "answer")
+    assert cache.get_exact("sys", "ctx", " What is RAG? ") == "answer"
+    assert cache.get_exact("sys", "ctx", "What is BM25?") is None
+    assert cache.exact_hits == 1
+
+
+def test_semantic_hit_needs_the_similarity_threshold():
+    cache = ResponseCache(max_entries=10, ttl=60, similarity=0.9)
+    cache.put("sys", "ctx", "question", "answer", embedding=[1.0, 0.0])
+    assert cache.get_similar("sys", "ctx", [0.99, 0.05]) == "answer"
+    assert cache.get_similar("sys", "ctx", [0.5, 0.5]) is None
+    assert (cache.semantic_hits, cache.misses) == (1, 1)
+
+
+def test_entries_are_partitioned_by_system_prompt_and_context():
+    cache = ResponseCache(max_entries=10, ttl=60, similarity=0.9)
+    cache.put("sys", "ctx", "question", "answer", embedding=[1.0, 0.0])
+    assert cache.get_exact("other sys", "ctx", "question") is None
+    assert cache.get_exact("sys", "other ctx", "question") is None
+    assert cache.get_similar("sys", "other ctx", [1.0, 0.0]) is None
+
+
+def test_expired_entries_miss(monkeypatch):
+    cache = ResponseCache(max_entries=10, ttl=10, similarity=0.9)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache.put("sys", "", "question", "answer", embedding=[1.0, 0.0])
+    monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+    assert cache.get_exact("sys", "", "question") is None
+    assert cache.get_similar("sys", "", [1.0, 0.0]) is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl=60, similarity=0.9)
+    cache.put("sys", "", "a", "answer a", embedding=[1.0, 0.0])
+    cache.put("sys", "", "b", "answer b")
+    cache.get_exact("sys", "", "a")
+    cache.put("sys", "", "c", "answer c")
+    assert cache.get_exact("sys", "", "b") is None
+    assert cache.get_exact("sys", "", "a") == "answer a"
+    assert cache.get_similar("sys", "", [1.0, 0.0]) == "answer a"
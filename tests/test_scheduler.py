@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.llm.scheduler import LLMScheduler, SchedulerRejected
+
+
+def _scheduler(**overrides):
+    options = dict(max_concurrency=1, max_queue=10, queue_timeout=1, user_rate=0, user_burst=1)
+    options.update(overrides)
+    return LLMScheduler(**options)
+
+
+def test_waiters_are_served_round_robin_across_users():
+    async def run():
+        scheduler = _scheduler()
+        holder = await scheduler.acquire("holder")
+        order = []
+
+        async def request(user, i):
+            async with scheduler.slot(user):
+                order.append(f"{user}{i}")
+
+        # "a" queues three requests before "b" and "c" queue one each
+        tasks = [asyncio.create_task(request("a", i)) for i in range(3)]
+        tasks += [asyncio.create_task(request(user, 0)) for user in ("b", "c")]
+        await asyncio.sleep(0)
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["a0", "b0", "c0", "a1", "a2"]
+
+
+def test_empty_bucket_is_rejected_with_429():
+    async def run():
+        scheduler = _scheduler(max_concurrency=10, user_rate=1, user_burst=2)
+        await scheduler.acquire("u")
+        await scheduler.acquire("u")
+        with pytest.raises(SchedulerRejected) as rejected:
+            await scheduler.acquire("u")
+        assert rejected.value.status_code == 429 and rejected.value.retry_after > 0
+        await scheduler.acquire("other")  # buckets are per user
+
+    asyncio.run(run())
+
+
+def test_full_queue_is_rejected_with_503_and_refunds_the_token():
+    async def run():
+        scheduler = _scheduler(max_queue=0, user_rate=0.001, user_burst=2)
+        await scheduler.acquire("holder")
+        with pytest.raises(SchedulerRejected) as rejected:
+            await scheduler.acquire("u")
+        assert rejected.value.status_code == 503
+        assert scheduler._buckets["u"][0] == pytest.approx(2, abs=0.01)
+
+    asyncio.run(run())
+
+
+def test_queue_timeout_is_rejected_with_503_and_refunds_the_token():
+    async def run():
+        scheduler = _scheduler(queue_timeout=0.05, user_rate=0.001, user_burst=1)
+        await scheduler.acquire("holder")
+        with pytest.raises(SchedulerRejected) as rejected:
+            await scheduler.acquire("u")
+        assert rejected.value.status_code == 503
+        assert scheduler.queued == 0 and scheduler.timed_out == 1
+        assert scheduler._buckets["u"][0] == pytest.approx(1, abs=0.01)
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def run():
+        scheduler = _scheduler()
+        holder = await scheduler.acquire("holder")
+        waiter = asyncio.create_task(scheduler.acquire("u"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        holder.release()
+        assert scheduler.active == 0 and scheduler.queued == 0
+        lease = await scheduler.acquire("v")
+        assert lease.wait == 0
+
+    asyncio.run(run())
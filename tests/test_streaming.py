@@ -0,0 +1,7 @@
+from app.streaming import _frame
+
+
+def test_frame_splits_every_line_ending():
+    frame = _frame("s", 3, "a\r\nb\rc\nd")
+    assert frame == "id: s:3\ndata: a\ndata: b\ndata: c\ndata: d\n\n"
+    assert "\r" not in frame
@@ -0,0 +1,112 @@
+import time
+
+import numpy as np
+import pytest
+
+from app import vector_store
+from app.vector_store import VectorStore, has_store
+
+DIM = 8
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).random((n, DIM), dtype=np.float32)
+
+
+def test_failed_first_ingest_leaves_store_untouched(tmp_path):
+    store = VectorStore(dim=DIM, path=str(tmp_path), mode="flat")
+
+    def batches():
+        yield _vectors(5), [f"chunk {i}" for i in range(5)]
+        raise RuntimeError("pipeline failed")
+
+    with pytest.raises(RuntimeError):
+        store.add_batches(batches())
+    assert store.index.ntotal == 0
+    assert len(store.texts) == 0
+
+    vectors = _vectors(3, seed=1)
+    store.add(vectors, ["a", "b", "c"])
+    assert store.index.ntotal == len(store.texts) == 3
+    assert store.search(vectors[1], k=1) == ["b"]
+
+    reopened = VectorStore(dim=DIM, path=str(tmp_path), mode="flat")
+    assert reopened.index.ntotal == len(reopened.texts) == 3
+
+
+def _wait_for_promotion(store):
+    deadline = time.monotonic() + 30
+    while store._promoting and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_first_ingest_publishes_a_version_that_reopens_from_disk(tmp_path):
+    store = VectorStore(dim=DIM, path=str(tmp_path), mode="flat")
+    assert store.version is None and store.index.ntotal == 0
+
+    vectors = _vectors(4)
+    store.add(vectors, ["a", "b", "c", "d"])
+    assert has_store(str(tmp_path))
+    assert store.version is not None
+
+    reopened = VectorStore(dim=DIM, path=str(tmp_path), mode="flat")
+    assert reopened.version == store.version
+    assert list(reopened.texts) == ["a", "b", "c", "d"]
+    assert reopened.search(vectors[2], k=1) == ["c"]
+
+
+def test_other_instances_pick_up_new_versions_on_refresh(tmp_path):
+    writer = VectorStore(dim=DIM, path=str(tmp_path), mode="flat")
+    writer.add(_vectors(2), ["a", "b"])
+    reader = VectorStore(dim=DIM, path=str(tmp_path), mode="flat")
+
+    vectors = _vectors(1, seed=1)
+    writer.add(vectors, ["c"])
+    assert reader.index.ntotal == 2
+    reader.refresh()
+    assert reader.index.ntotal == 3
+    assert reader.search(vectors[0], k=1) == ["c"]
+
+
+def test_failed_ingest_keeps_the_published_version(tmp_path):
+    store = VectorStore(dim=DIM, path=str(tmp_path), mode="flat")
+    vectors = _vectors(3)
+    store.add(vectors, ["a", "b", "c"])
+    version = store.version
+
+    def batches():
+        yield _vectors(2, seed=1), ["x", "y"]
+        raise RuntimeError("pipeline failed")
+
+    with pytest.raises(RuntimeError):
+        store.add_batches(batches())
+    assert store.version == version
+    assert store.index.ntotal == len(store.texts) == 3
+    assert store.search(vectors[0], k=1) == ["a"]
+
+
+def test_auto_mode_promotes_to_hnsw(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "RAG_ANN_THRESHOLD", 50)
+    store = VectorStore(dim=DIM, path=str(tmp_path), mode="auto")
+    vectors = _vectors(60)
+    store.add(vectors, [f"chunk {i}" for i in range(60)])
+    _wait_for_promotion(store)
+
+    assert store.kind == "hnsw"
+    assert store.index.ntotal == len(store.texts) == 60
+    assert store.search(vectors[7], k=1) == ["chunk 7"]
+    assert VectorStore(dim=DIM, path=str(tmp_path)).kind == "hnsw"
+
+
+def test_ivfpq_mode_promotes_once_there_is_enough_training_data(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "RAG_PQ_M", 4)
+    store = VectorStore(dim=DIM, path=str(tmp_path), mode="ivfpq")
+    store.add(_vectors(100), [f"chunk {i}" for i in range(100)])
+    _wait_for_promotion(store)
+    assert store.kind == "flat"
+
+    n = vector_store.IVFPQ_MIN_TRAIN
+    store.add(_vectors(n, seed=1), [f"more {i}" for i in range(n)])
+    _wait_for_promotion(store)
+    assert store.kind == "ivfpq"
+    assert store.index.ntotal == len(store.texts) == n + 100